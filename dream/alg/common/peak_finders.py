@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.optimize import bisect
+
+FEX_DT = 0.1682692307692308  # ns per FEX sample
 
 class hsd_peak_finder():
     def __init__(self, det_id, sig_names, mapping, params, requested_vars): 
@@ -20,6 +21,8 @@ class hsd_peak_finder():
                 else:
                     self.finder[self.mapping[k1+k2]] = PyCFD(self.params['dld'])    
         self.ts_wf = None
+        self.fex_dt = FEX_DT
+        self.fex_batch = self.params.get('fex_batch', False)
         
         self.avail_vars = ['wf', 'pdd', 'tpks', 'hpks', 'len_tpks']
         self.num_keys = len(self.params['keys'].keys())
@@ -39,6 +42,8 @@ class hsd_peak_finder():
             else:
                 for k2 in sig_names:
                     self.requested[k1][k2] = False       
+
+        self.access_plan = fex_access_plan(self.params['keys'], self.mapping, self.requested)
     
 
 
@@ -76,10 +81,7 @@ class hsd_peak_finder():
         self.num_None = 0
         
         for k1 in self.params['keys'].keys():
-            peaks = det[k1].raw.peaks(evt)  
-            wfs = det[k1].raw.waveforms(evt) 
-            padded = det[k1].raw.padded(evt) 
-            fex_status_2 = det[k1].raw.fex_status(evt)
+            peaks, fex_status_2, wfs, padded = self.access_plan.fetch(k1, det[k1].raw, evt)
             if peaks is None:
                 #print(k1+' FEX is empty!!!')
                 self.num_None += 1
@@ -90,26 +92,11 @@ class hsd_peak_finder():
                 key_pks = self.mapping[k1+str(k2)]
                 starts = np.array(peaks[k2][0][0]).astype('float')
                 amps = peaks[k2][0][1]
-                tpks_all = np.empty((0,), dtype=float)
-                if self.requested['hpks'][key_pks]: hpks_all = np.empty((0,), dtype=float)
-                for j, (start, amp) in enumerate(zip(starts, amps)):                    
-                    if fex_status>0:
-                        #print('FEX wrapped, unwrapping it now.')
-                        amp = np.unwrap(amp, period=32768)
-                    amp = amp.astype('float')
-                    ts = (start + np.arange(len(amp)))*0.1682692307692308
-                    
-                    tpks = self.finder[key_pks](amp, ts)   
-                     
-                    if len(tpks)==0: continue                  
-
-                    tpks_all = np.concatenate([tpks_all, tpks])
-
-                    if self.requested['hpks'][key_pks]:
-                        hpks = self.finder[key_pks].get_heights(amp, ts, tpks)  
-                        hpks_all = np.concatenate([hpks_all, hpks])
+                if self.fex_batch:
+                    tpks_all, hpks_all = self.fex_channel_batched(key_pks, starts, amps, fex_status)
+                else:
+                    tpks_all, hpks_all = self.fex_channel(key_pks, starts, amps, fex_status)
 
-                
                 self.tpks_dict[key_pks] = tpks_all
                 self.len_tpks_dict[key_pks] = np.array([len(tpks_all)])
               
@@ -133,6 +120,137 @@ class hsd_peak_finder():
 
     
         
+    def fex_channel(self, key_pks, starts, amps, fex_status):
+        tpks_all = np.empty((0,), dtype=float)
+        hpks_all = np.empty((0,), dtype=float) if self.requested['hpks'][key_pks] else None
+        for j, (start, amp) in enumerate(zip(starts, amps)):                    
+            if fex_status>0:
+                #print('FEX wrapped, unwrapping it now.')
+                amp = np.unwrap(amp, period=32768)
+            amp = amp.astype('float')
+            ts = (start + np.arange(len(amp)))*self.fex_dt
+            
+            tpks = self.finder[key_pks](amp, ts)   
+             
+            if len(tpks)==0: continue                  
+
+            tpks_all = np.concatenate([tpks_all, tpks])
+
+            if hpks_all is not None:
+                hpks = self.finder[key_pks].get_heights(amp, ts, tpks)  
+                hpks_all = np.concatenate([hpks_all, hpks])
+
+        return tpks_all, hpks_all
+
+
+    def fex_channel_batched(self, key_pks, starts, amps, fex_status):
+        tpks_all, hpks_all, _ = self.fex_windows(key_pks, starts, amps, fex_status>0)
+        return tpks_all, hpks_all
+
+
+    def fex_windows(self, key_pks, starts, amps, unwrap):
+        # all FEX windows packed into one buffer with segment offsets; `unwrap` is a
+        # flag for all windows or one per window. Also returns the window of every peak.
+        nseg = len(amps)
+        if nseg == 0:
+            hpks_all = np.empty((0,), dtype=float) if self.requested['hpks'][key_pks] else None
+            return np.empty((0,), dtype=float), hpks_all, np.empty((0,), dtype=int)
+
+        lens = np.fromiter((len(amp) for amp in amps), dtype=int, count=nseg)
+        offsets = np.zeros(nseg+1, dtype=int)
+        np.cumsum(lens, out=offsets[1:])
+        amp = np.concatenate(amps).astype('float')
+        if np.any(unwrap):
+            unwrapped = unwrap_segments(amp, offsets, period=32768)
+            amp = unwrapped if np.all(unwrap) else np.where(np.repeat(unwrap, lens), unwrapped, amp)
+
+        seg_start = np.repeat(offsets[:-1], lens)
+        ts = (np.repeat(starts, lens) + (np.arange(offsets[-1]) - seg_start))*self.fex_dt
+        seg = np.repeat(np.arange(nseg), lens)
+
+        finder = self.finder[key_pks]
+        tpks_all, seg_pks = finder.find_peaks_segments(amp, ts, seg)
+
+        hpks_all = None
+        if self.requested['hpks'][key_pks]:
+            # heights are bounded by the window end, so they stay per window
+            hpks_all = np.empty(tpks_all.shape, dtype=float)
+            bounds = np.flatnonzero(np.diff(seg_pks)) + 1
+            for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, seg_pks.size]):
+                if lo == hi: continue
+                g = seg_pks[lo]
+                sl = slice(offsets[g], offsets[g+1])
+                hpks_all[lo:hi] = finder.get_heights(amp[sl], ts[sl], tpks_all[lo:hi])
+
+        return tpks_all, hpks_all, seg_pks
+
+
+    def find_peaks_events(self, det, events):
+        """
+        FEX peak finding for several events with one CFD pass per channel over the
+        windows of all of them. Sets `event_tpks` (channel -> peaks of all events
+        back to back), `event_counts` (channel -> peaks per event) and
+        `event_exist`, and returns the per-event `data_dict` that __call__ gives.
+        """
+        n = len(events)
+        windows = {}                       # key_pks -> starts, amps, unwrap flags, event of each window
+        present = [{} for _ in range(n)]   # per event: key_pks -> (k2, wfs, padded)
+        exist = np.zeros(n, dtype=bool)
+        for i, evt in enumerate(events):
+            try:
+                reads = [(k1,) + self.access_plan.fetch(k1, det[k1].raw, evt) for k1 in self.params['keys']]
+            except Exception:
+                continue   # like __call__: an event that cannot be read has no peaks
+            for k1, peaks, fex_status, wfs, padded in reads:
+                if peaks is None: continue
+                exist[i] = True
+                for k2 in peaks.keys():
+                    key_pks = self.mapping[k1+str(k2)]
+                    amps = peaks[k2][0][1]
+                    w = windows.setdefault(key_pks, ([], [], [], []))
+                    w[0].append(np.array(peaks[k2][0][0]).astype('float'))
+                    w[1].extend(amps)
+                    w[2].append(np.full(len(amps), fex_status[k2][0][0][0] > 0))
+                    w[3].append(np.full(len(amps), i))
+                    present[i][key_pks] = (k2, wfs, padded)
+
+        self.event_tpks, self.event_counts, self.event_exist = {}, {}, exist
+        hpks, offsets = {}, {}
+        for key_pks, (starts, amps, unwrap, win_evt) in windows.items():
+            tpks, hpks[key_pks], seg_pks = self.fex_windows(key_pks, np.concatenate(starts), amps, np.concatenate(unwrap))
+            counts = np.bincount(np.concatenate(win_evt)[seg_pks], minlength=n)
+            self.event_tpks[key_pks] = tpks
+            self.event_counts[key_pks] = counts
+            offsets[key_pks] = np.r_[0, np.cumsum(counts)]
+
+        outs = []
+        for i in range(n):
+            d = {k: {} for k in self.data_dict}
+            if not exist[i]:
+                for k1 in self.avail_vars:
+                    k1_p = k1+'_'+self.det_id
+                    d[k1_p] = {}
+                    for k2 in self.sig_names:
+                        if self.requested[k1][k2]:
+                            d[k1_p][k2] = np.array([0]) if 'len' in k1_p else np.array([])
+                outs.append(d)
+                continue
+            for key_pks, (k2, wfs, padded) in present[i].items():
+                lo, hi = offsets[key_pks][i], offsets[key_pks][i+1]
+                if self.requested['pdd'][key_pks] and padded is not None:
+                    d['pdd_'+self.det_id][key_pks] = padded[k2][0].astype(float)
+                if self.requested['wf'][key_pks] and wfs is not None:
+                    d['wf_'+self.det_id][key_pks] = wfs[k2][0].astype(float)
+                if self.requested['tpks'][key_pks]:
+                    d['tpks_'+self.det_id][key_pks] = self.event_tpks[key_pks][lo:hi]
+                if self.requested['len_tpks'][key_pks]:
+                    d['len_tpks_'+self.det_id][key_pks] = np.array([hi - lo])
+                if self.requested['hpks'][key_pks]:
+                    d['hpks_'+self.det_id][key_pks] = hpks[key_pks][lo:hi]
+            outs.append(d)
+        return outs
+
+        
     def find_peaks_raw(self, det, evt):
         self.tpks_dict = {}
         self.len_tpks_dict = {}   
@@ -161,6 +279,48 @@ class hsd_peak_finder():
 
 
 
+class fex_access_plan:
+    """
+    Raw accessors needed per digitizer for the whole run, derived once from `requested`.
+
+    peaks and fex_status are always read (the CFD needs them); waveforms and padded
+    are only decoded for digitizers with at least one requested wf_*/pdd_* channel.
+    """
+    def __init__(self, keys, mapping, requested):
+        self.waveforms = {}
+        self.padded = {}
+        for k1, vals in keys.items():
+            sig_names = [mapping[k1+k2] for k2 in vals]
+            self.waveforms[k1] = any(requested['wf'][k2] for k2 in sig_names)
+            self.padded[k1] = any(requested['pdd'][k2] for k2 in sig_names)
+
+    def fetch(self, k1, raw, evt):
+        peaks = raw.peaks(evt)
+        if peaks is None:
+            return None, None, None, None
+        fex_status = raw.fex_status(evt)
+        wfs = raw.waveforms(evt) if self.waveforms[k1] else None
+        padded = raw.padded(evt) if self.padded[k1] else None
+        return peaks, fex_status, wfs, padded
+
+
+def unwrap_segments(amp, offsets, period):
+    """
+    np.unwrap applied independently to every segment amp[offsets[i]:offsets[i+1]]
+    of a packed float buffer, in one pass (no correction carries across segments).
+    """
+    dd = np.diff(amp)
+    interval_high = period/2
+    ddmod = np.mod(dd + interval_high, period) - interval_high
+    ddmod[(ddmod == -interval_high) & (dd > 0)] = interval_high
+    ph_correct = ddmod - dd
+    ph_correct[np.abs(dd) < interval_high] = 0
+    csum = np.zeros(amp.size+1, dtype=float)
+    np.cumsum(ph_correct, out=csum[1:amp.size])
+    lens = np.diff(offsets)
+    return amp + (csum[:amp.size] - np.repeat(csum[offsets[:-1]], lens))
+
+
 class PyCFD:
 
     def __init__(self, params):
@@ -174,14 +334,16 @@ class PyCFD:
         self.timerange_high = params['timerange_high']
         self.offset = params['offset']
         self.xtol = 0.1*self.sample_interval
+        self.rtol = 4*np.finfo(float).eps # scipy.optimize.bisect defaults
+        self.maxiter = 100
 
 
     def __call__(self, *args, **kwargs):
         return self.find_peaks(*args, **kwargs)    
 
         
-    def NewtonPolynomial3(self,x,x_arr,y_arr):
-    
+    def NewtonCoeffs3(self, x_arr, y_arr):
+        # divided differences of the cubic through 4 points; x_arr/y_arr may be (4,) or (4, K)
         d_0_1 = (y_arr[1] - y_arr[0])/(x_arr[1] - x_arr[0])
         d_1_2 = (y_arr[2] - y_arr[1])/(x_arr[2] - x_arr[1])
         d_2_3 = (y_arr[3] - y_arr[2])/(x_arr[3] - x_arr[2])
@@ -190,12 +352,14 @@ class PyCFD:
         d_1_2_3 = (d_2_3 - d_1_2)/(x_arr[3] - x_arr[1])        
         d_0_1_2_3 = (d_1_2_3 - d_0_1_2)/(x_arr[3] - x_arr[0])
         
-        c0 = y_arr[0]
-        c1 = d_0_1
-        c2 = d_0_1_2
-        c3 = d_0_1_2_3
-        
+        return y_arr[0], d_0_1, d_0_1_2, d_0_1_2_3
+
+    def NewtonEval3(self, x, x_arr, coeffs):
+        c0, c1, c2, c3 = coeffs
         return c0 + c1*(x-x_arr[0]) + c2*(x-x_arr[0])*(x-x_arr[1]) + c3*(x-x_arr[0])*(x-x_arr[1])*(x-x_arr[2])
+
+    def NewtonPolynomial3(self,x,x_arr,y_arr):
+        return self.NewtonEval3(x, x_arr, self.NewtonCoeffs3(x_arr, y_arr))
         
             
     def find_peaks(self,wf, wt):        
@@ -214,36 +378,94 @@ class PyCFD:
         (wf_cal_m_walk_sign[1:] != 0) & ((wf_cal_m_walk[1:] - wf_cal_m_walk[:-1]) >= 1e-8))[0] #find the sign change locations of wf_cal_m_walk
 
         #check if the orignal signal is above the threhold at sign change locations of wf_cal_m_walk
-        wf_cal_ind_ind = np.where(self.polarity*wf_1[wf_cal_ind] > (self.threshold+self.polarity*self.offset))[0]  
+        inds = wf_cal_ind[self.polarity*wf_1[wf_cal_ind] > (self.threshold+self.polarity*self.offset)]
 
-        
-        t_cfd_arr = np.empty([0,])
-        
-        
-        #The arrival time t_cfd is obtained from the Newton Polynomial fitted to the 4 data points around the location found from above.
-        try:
-            for ind in wf_cal_ind_ind:
+        #the 4-point window [ind-1, ind+3) has to fit inside the bipolar signal
+        inds = inds[(inds >= 1) & (inds + 3 <= wf_cal_m_walk.size)]
 
-                t_arr = wt[(wf_cal_ind[ind]-1):(wf_cal_ind[ind]+3)]
+        return self.cfd_times(wt, wf_cal_m_walk, inds)
 
-                wf_cal_m_walk_arr = wf_cal_m_walk[(wf_cal_ind[ind]-1):(wf_cal_ind[ind]+3)]
-            
-                if len(t_arr) != 4 or len(wf_cal_m_walk_arr) != 4:
-                    continue
-            
-                if (t_arr[1] - t_arr[0])==0 or (t_arr[2] - t_arr[1])==0 or (t_arr[3] - t_arr[2])==0:
-                    continue
-                
-                if (t_arr[2] - t_arr[0])==0 or (t_arr[3] - t_arr[1])==0 or (t_arr[3] - t_arr[0])==0:
-                    continue
-            
-                t_cfd = bisect(self.NewtonPolynomial3,t_arr[1],t_arr[2],args=(t_arr, wf_cal_m_walk_arr),xtol=self.xtol)
-            
-                t_cfd_arr = np.append(t_cfd_arr,t_cfd)
-        except:
-            t_cfd_arr = np.append(t_cfd_arr,wt[wf_cal_ind[ind]])
 
-        return t_cfd_arr
+    def find_peaks_segments(self, wf, wt, seg):
+        """
+        CFD over several FEX windows packed back to back in one buffer.
+
+        `seg` holds the window index of every sample. Crossings whose 4-point
+        window or delayed samples reach into a neighbouring window are masked, so
+        the result equals running find_peaks window by window and concatenating.
+        Returns the arrival times and the window index of each of them.
+        """
+        wt_inds = (wt>self.timerange_low)&(wt<self.timerange_high)
+        wf = wf[wt_inds] 
+        wt = wt[wt_inds]
+        seg = seg[wt_inds]
+
+        wf_1 = wf[:-self.delay]
+        wf_2 = wf[self.delay:]
+
+        wf_cal = wf_1 - self.fraction*wf_2
+        wf_cal_m_walk = self.polarity*wf_cal-self.walk+self.polarity*(self.fraction*self.offset-self.offset)
+        wf_cal_m_walk_sign = np.sign(wf_cal_m_walk) 
+
+        wf_cal_ind = np.where((wf_cal_m_walk_sign[:-1] < wf_cal_m_walk_sign[1:]) & 
+        (wf_cal_m_walk_sign[1:] != 0) & ((wf_cal_m_walk[1:] - wf_cal_m_walk[:-1]) >= 1e-8))[0]
+
+        inds = wf_cal_ind[self.polarity*wf_1[wf_cal_ind] > (self.threshold+self.polarity*self.offset)]
+        inds = inds[(inds >= 1) & (inds + 3 <= wf_cal_m_walk.size)]
+
+        #samples ind-1 ... ind+2+delay feed the fit; they must all come from one window
+        inds = inds[seg[inds-1] == seg[inds+2+self.delay]]
+
+        t_cfd_arr, inds = self.cfd_times(wt, wf_cal_m_walk, inds, return_inds=True)
+        return t_cfd_arr, seg[inds]
+
+
+    def cfd_times(self, wt, wf_cal_m_walk, inds, return_inds=False):
+        """
+        Arrival times for all crossings at once.
+
+        The arrival time is the root of the Newton cubic fitted to the 4 points
+        around each crossing index in `inds`, located by a batched bisection that
+        reproduces scipy.optimize.bisect step by step (same xtol/rtol stopping rule).
+        """
+        if inds.size == 0:
+            t_cfd_arr = np.empty((0,), dtype=float)
+            return (t_cfd_arr, inds) if return_inds else t_cfd_arr
+
+        win = inds[:, np.newaxis] + np.arange(-1, 3)
+        t_arr = wt[win].T
+        y_arr = wf_cal_m_walk[win].T
+
+        # drop degenerate windows (repeated time stamps)
+        valid = ((t_arr[1] != t_arr[0]) & (t_arr[2] != t_arr[1]) & (t_arr[3] != t_arr[2]) &
+                 (t_arr[2] != t_arr[0]) & (t_arr[3] != t_arr[1]) & (t_arr[3] != t_arr[0]))
+        if not valid.all():
+            t_arr, y_arr, inds = t_arr[:, valid], y_arr[:, valid], inds[valid]
+
+        coeffs = self.NewtonCoeffs3(t_arr, y_arr)
+
+        xa = t_arr[1].copy()
+        xb = t_arr[2]
+        fa = self.NewtonEval3(xa, t_arr, coeffs)
+        fb = self.NewtonEval3(xb, t_arr, coeffs)
+
+        # no bracket -> fall back to the sample time of the crossing (xa)
+        t_cfd_arr = np.where((fb == 0) & (fa != 0) & (fa*fb <= 0), xb, xa)
+        active = (fa*fb <= 0) & (fa != 0) & (fb != 0)
+
+        dm = xb - xa
+        for _ in range(self.maxiter):
+            if not active.any():
+                break
+            dm = dm*0.5
+            xm = xa + dm
+            fm = self.NewtonEval3(xm, t_arr, coeffs)
+            xa = np.where(active & (fm*fa >= 0), xm, xa)
+            stop = active & ((fm == 0) | (np.abs(dm) < self.xtol + self.rtol*np.abs(xm)))
+            t_cfd_arr[stop] = xm[stop]
+            active &= ~stop
+
+        return (t_cfd_arr, inds) if return_inds else t_cfd_arr
 
 
     def get_heights(self, wf, wt, t_arr):
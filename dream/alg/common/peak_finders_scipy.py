@@ -2,6 +2,7 @@ import os
 import numpy as np
 from scipy.signal import find_peaks
 from dream.util.misc import read_config
+from dream.alg.common.peak_finders import FEX_DT
 
 class hsd_peak_finder():
     def __init__(self, det_id, sig_names, mapping, params=None, requested_vars=None, **kwargs): 
@@ -76,7 +77,7 @@ class hsd_peak_finder():
                     amp = amp.astype('float')
                     ts = start + np.arange(len(amp))
                     
-                    tpks = self.finder[key_pks](amp.astype(float),ts*0.1682692307692308)     
+                    tpks = self.finder[key_pks](amp.astype(float),ts*FEX_DT)     
                      
                     if len(tpks)==0: continue
 
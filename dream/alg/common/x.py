@@ -2,6 +2,23 @@ import numpy as np
 from scipy.ndimage import gaussian_filter1d
 from scipy.signal import find_peaks    
 
+
+def x_bind(alg, record, det):
+    alg.slots = [record.index.get(name) for name in alg.x_names]
+    alg.getters = alg.resolve(det)
+
+
+def x_fill(alg, record, evt):
+    """Write the x values of one event straight into the record slots bound by x_bind."""
+    try:
+        vals = alg.read(alg.getters, evt)
+    except Exception as err:
+        vals = [np.nan]*len(alg.slots)
+    values = record.values
+    for slot, v in zip(alg.slots, vals):
+        if slot is not None: values[slot] = v
+
+
 class scan:
     def __init__(self, requested_vars):
 
@@ -9,6 +26,7 @@ class scan:
         self.requested_vars = requested_vars
         self.data_dict = {}
         self.det_id = 'scan'
+        self.x_names = [self.det_id+':'+requested_var for requested_var in self.requested_vars[self.det_id]]
 
     def get_det_keys(self, run):
         try:
@@ -43,6 +61,19 @@ class scan:
         for i, requested_var in enumerate(self.requested_vars[self.det_id]): 
             self.data_dict['x'][self.det_id+':'+requested_var] = det[self.params['det']['keys'][i]](evt) if det[self.params['det']['keys'][i]] is not None else np.nan   
 
+    def resolve(self, det):
+        return [det.get(k) for k in self.params['det']['keys'][:len(self.x_names)]]
+
+    def read(self, getters, evt):
+        vals = [getter(evt) if getter is not None else np.nan for getter in getters]
+        return [v if v is not None else np.nan for v in vals]
+
+    def bind(self, record, det):
+        x_bind(self, record, det)
+
+    def fill(self, record, det, evt):
+        x_fill(self, record, evt)
+
 class bld:
     def __init__(self, requested_vars):
 
@@ -50,6 +81,7 @@ class bld:
         self.requested_vars = requested_vars
         self.data_dict = {}
         self.det_id = 'bld'
+        self.x_names = [self.det_id+':'+requested_var for requested_var in self.requested_vars[self.det_id]]
 
     def get_det_keys(self, run):
         try:
@@ -80,6 +112,19 @@ class bld:
             if not self.data_dict['x'][self.det_id+':'+requested_var]:
                 self.data_dict['x'][self.det_id+':'+requested_var] = np.nan 
 
+    def resolve(self, det):
+        return [det[k].raw.milliJoulesPerPulse if det.get(k) is not None else None for k in self.params['det']['keys'][:len(self.x_names)]]
+
+    def read(self, getters, evt):
+        vals = [getter(evt) if getter is not None else np.nan for getter in getters]
+        return [v if v else np.nan for v in vals]
+
+    def bind(self, record, det):
+        x_bind(self, record, det)
+
+    def fill(self, record, det, evt):
+        x_fill(self, record, evt)
+
 class epics:
     def __init__(self, requested_vars):
 
@@ -87,6 +132,7 @@ class epics:
         self.requested_vars = requested_vars
         self.data_dict = {}
         self.det_id = 'epics'
+        self.x_names = [self.det_id+':'+requested_var for requested_var in self.requested_vars[self.det_id]]
 
     def get_det_keys(self, run):
         try:
@@ -119,6 +165,19 @@ class epics:
         for i, requested_var in enumerate(self.requested_vars[self.det_id]):
             self.data_dict['x'][self.det_id+':'+requested_var] = det[self.params['det']['keys'][i]](evt) if det[self.params['det']['keys'][i]] is not None and det[self.params['det']['keys'][i]](evt) is not None else np.nan   
 
+    def resolve(self, det):
+        return [det.get(k) for k in self.params['det']['keys'][:len(self.x_names)]]
+
+    def read(self, getters, evt):
+        vals = [getter(evt) if getter is not None else np.nan for getter in getters]
+        return [v if v is not None else np.nan for v in vals]
+
+    def bind(self, record, det):
+        x_bind(self, record, det)
+
+    def fill(self, record, det, evt):
+        x_fill(self, record, evt)
+
 
 class timing:
     def __init__(self, requested_vars):
@@ -127,6 +186,10 @@ class timing:
         self.requested_vars = requested_vars
         self.data_dict = {}
         self.det_id = 'timing'
+        self.x_names = [self.det_id+':'+requested_var for requested_var in self.requested_vars[self.det_id]]
+        self.codes_or_dest = [None if requested_var == 'dest' else int(requested_var) for requested_var in self.requested_vars[self.det_id]]
+        self.codes = any(code is not None for code in self.codes_or_dest)
+        self.dest = None in self.codes_or_dest
 
     def get_det_keys(self, run):
 
@@ -159,6 +222,22 @@ class timing:
             else:
                 self.data_dict['x'][self.det_id+':'+requested_var] = det_timing.raw.eventcodes(evt)[int(requested_var)] if det_timing is not None else np.nan 
 
+    def resolve(self, det):
+        return next(iter(det.values()))
+
+    def read(self, det_timing, evt):
+        if det_timing is None:
+            return [np.nan]*len(self.x_names)
+        eventcodes = det_timing.raw.eventcodes(evt) if self.codes else None
+        dest = det_timing.raw.destination(evt) if self.dest else None
+        return [dest if code is None else eventcodes[code] for code in self.codes_or_dest]
+
+    def bind(self, record, det):
+        x_bind(self, record, det)
+
+    def fill(self, record, det, evt):
+        x_fill(self, record, evt)
+
 
 class atm:
     def __init__(self, requested_vars):
@@ -176,6 +255,7 @@ class atm:
         self.beta = self.params['beta']
         
         self.requested_vars = requested_vars
+        self.x_names = [self.det_id+':'+var for var in ['edge', 'prom'] if var in self.requested_vars[self.det_id]]
 
         if 'edge' in self.requested_vars[self.det_id]:
             self.x_atm = np.arange(2048)
@@ -196,6 +276,7 @@ class atm:
                 
         return self.data_dict
 
+
     def get_vars(self, det, evt, x, *args, **kwargs):
         
         line = next(iter(det.values())).raw.raw(evt)
@@ -207,24 +288,47 @@ class atm:
         if gline_req: self.data_dict['atm']['gline'] = gaussian_filter1d(line,self.params['gfw']) if line_exists else []
 
         if 'edge' in self.requested_vars[self.det_id]:
-            edge = np.nan
-            prom = np.nan
             self.data_dict['x'] = {}
-            if line_exists:
-                if x['timing:281'] == 1:
-                    if self.bkg is None:
-                        self.bkg = line
-                    else:
-                        self.bkg = self.bkg*(1.-self.beta) + line*self.beta     
-             
-                if x['timing:280'] == 1:
-                    if self.bkg is None: 
-                        edge = np.nan
-                        prom = np.nan
-                    else:
-                        edge, prom = self.find_edges(line, self.bkg)
+            edge, prom = self.update_edge(line, x)
             self.data_dict['x'][self.det_id+':'+'edge'] = edge
             if 'prom' in self.requested_vars[self.det_id]: self.data_dict['x'][self.det_id+':'+'prom'] = prom
+
+    def update_edge(self, line, x):
+        # background from timing:281 events, edge on timing:280 events
+        edge, prom = np.nan, np.nan
+        if line is None: return edge, prom
+        if x['timing:281'] == 1:
+            self.bkg = line if self.bkg is None else self.bkg*(1.-self.beta) + line*self.beta
+        if x['timing:280'] == 1 and self.bkg is not None:
+            edge, prom = self.find_edges(line, self.bkg)
+        return edge, prom
+
+    def resolve(self, det):
+        return next(iter(det.values())).raw
+
+    def bind(self, record, det):
+        x_bind(self, record, det)
+        self.line_slots = [(record.index.get(self.det_id+':'+var), var == 'gline') for var in ('line', 'gline') if var in self.requested_vars[self.det_id]]
+
+    def fill(self, record, det, evt):
+        values = record.values
+        try:
+            line = self.getters.raw(evt)
+        except Exception as err:
+            print('atm error:', err)
+            line = None
+        for slot, gline in self.line_slots:
+            if slot is None: continue
+            if line is None: values[slot] = []
+            else: values[slot] = gaussian_filter1d(line, self.params['gfw']) if gline else line
+        if 'edge' not in self.requested_vars[self.det_id]: return
+        try:
+            edge, prom = self.update_edge(line, record)
+        except Exception as err:
+            print('atm error:', err)
+            edge, prom = np.nan, np.nan
+        for slot, v in zip(self.slots, (edge, prom)):
+            if slot is not None: values[slot] = v
         
 
     def find_edges(self, atm, bkg, hw=300):
@@ -259,6 +363,7 @@ class atm:
 
 class fzp:
     def __init__(self, requested_vars):
+        import os
         from dream.util.misc import read_config
         self.det_id = 'fzp'
 
@@ -269,6 +374,7 @@ class fzp:
         self.params = params
         self.hw_fzp = params['hw']
         self.requested_vars = requested_vars
+        self.x_names = [f"{self.det_id}:{name}" for name in ('xmax', 'm1', 'm2', 'area') if name in self.requested_vars[self.det_id]]
         self.data_dict = {}
        
       
@@ -283,6 +389,7 @@ class fzp:
                 
         return self.data_dict
 
+
     def get_vars(self, det, evt, *args, **kwargs):
         self.data_dict['x'] = {}
         prj = next(iter(det.values())).raw.raw(evt)
@@ -291,6 +398,19 @@ class fzp:
             if name in self.requested_vars[self.det_id]:
                 self.data_dict['x'][f"{self.det_id}:{name}"] = value
 
+    def resolve(self, det):
+        return next(iter(det.values())).raw
+
+    def read(self, det_raw, evt):
+        moments = dict(zip(('xmax', 'm1', 'm2', 'area'), self.PhotonSpectrumMoments(det_raw.raw(evt), self.hw_fzp)))
+        return [moments[name.split(':')[1]] for name in self.x_names]
+
+    def bind(self, record, det):
+        x_bind(self, record, det)
+
+    def fill(self, record, det, evt):
+        x_fill(self, record, evt)
+
     
     def PhotonSpectrumMoments(self,proj,hw):
         """Get the center, FWHM, AOC of the photon spectrum by direct calculation of first, second moments and array sum.
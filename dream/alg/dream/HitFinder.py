@@ -45,7 +45,16 @@ class HitFinder:
     
         
         
-    def FindHits(self, McpSig, u1Sig, u2Sig, v1Sig, v2Sig, w1Sig, w2Sig):
+    def FindHits(self, McpSig, u1Sig, u2Sig, v1Sig, v2Sig, w1Sig, w2Sig, events=None):
+        """
+        Hits of all MCP peaks. `events` (one int array per signal, in argument order)
+        packs several events into one call: anode windows are then only searched
+        among peaks of the same event and data_dict['event'] holds the event of
+        every hit.
+        """
+        McpSig = np.asarray(McpSig, dtype=float)
+        n_mcp = McpSig.size
+        e_mcp, e_u1, e_u2, e_v1, e_v2, e_w1, e_w2 = events if events is not None else [None]*7
 
         t1u = (-self.uRunTime+2*McpSig+self.uTSumAvg-np.abs(self.u_diff_offset))/2
         t2u = (self.uRunTime+2*McpSig+self.uTSumAvg+np.abs(self.u_diff_offset))/2
@@ -56,111 +65,120 @@ class HitFinder:
         t1w = (-self.wRunTime+2*McpSig+self.wTSumAvg-np.abs(self.w_diff_offset))/2
         t2w = (self.wRunTime+2*McpSig+self.wTSumAvg+np.abs(self.w_diff_offset))/2           
         
-        
-        self.list_dict = {}
+        self.data_dict = {}
+
+        # anode pairs with a valid time sum, for all MCP hits at once
+        iu, u1, u2 = self.window_pairs(McpSig, u1Sig, u2Sig, t1u, t2u, self.uTSumLow, self.uTSumHigh, e_mcp, e_u1, e_u2)
+        iv, v1, v2 = self.window_pairs(McpSig, v1Sig, v2Sig, t1v, t2v, self.vTSumLow, self.vTSumHigh, e_mcp, e_v1, e_v2)
+
+        sum_u = u1+u2 - 2*McpSig[iu] - self.uTSumAvg
+        sum_v = v1+v2 - 2*McpSig[iv] - self.vTSumAvg 
+        sub_u = u1-u2
+        sub_v = v1-v2
+
+        if self.reconstruction_k_diag_tsum or self.reconstruction_k_diag_diff:
+            iw, w1, w2 = self.window_pairs(McpSig, w1Sig, w2Sig, t1w, t2w, self.wTSumLow, self.wTSumHigh, e_mcp, e_w1, e_w2)
+            sum_w = w1+w2 - 2*McpSig[iw] - self.wTSumAvg             
+            sub_w = w1-w2
 
         if self.reconstruction_k_diag_tsum:
-            for k in ['u','v','w']:
-                self.list_dict['tsum_'+k] = [] 
+            self.data_dict['tsum_u'] = self.pick_one_per_hit(iu, sum_u, n_mcp)
+            self.data_dict['tsum_v'] = self.pick_one_per_hit(iv, sum_v, n_mcp)
+            self.data_dict['tsum_w'] = self.pick_one_per_hit(iw, sum_w, n_mcp)
 
         if self.reconstruction_k_diag_diff:
-            for k in ['u','v','w']:
-                self.list_dict['diff_'+k] = []        
+            self.data_dict['diff_u'] = self.pick_one_per_hit(iu, sub_u, n_mcp)
+            self.data_dict['diff_v'] = self.pick_one_per_hit(iv, sub_v, n_mcp)
+            self.data_dict['diff_w'] = self.pick_one_per_hit(iw, sub_w, n_mcp)
             
-        self.list_dict['x'] = []
-        self.list_dict['y'] = []
-        self.list_dict['t'] = []
+        sub_uf = (sub_u-self.u_diff_offset)*self.f_u/2
+        sub_vf = (sub_v-self.v_diff_offset)*self.f_v/2
 
-        self.data_dict = {}
+        # every (u pair, v pair) combination of the same MCP hit, row-major in (u, v)
+        i_uv, pu, pv = self.combinations_per_hit(iu, iv, n_mcp)
 
-        # if self.reconstruction_k_diag_tsum:
-        #     for k in ['u','v','w']:
-        #         self.data_dict['tsum_'+k] = np.array([])  
+        tsum_abs = np.abs(sum_u[pu]) + np.abs(sum_v[pv])
 
-        # if self.reconstruction_k_diag_diff:
-        #     for k in ['u','v','w']:
-        #         self.data_dict['diff_'+k] = np.array([])  
-    
-               
-        for i_McpT, McpT in enumerate(McpSig):
-           
-            u1 = u1Sig[(u1Sig>t1u[i_McpT]) & (u1Sig<t2u[i_McpT])]
-            u2 = u2Sig[(u2Sig>t1u[i_McpT]) & (u2Sig<t2u[i_McpT])]
-            v1 = v1Sig[(v1Sig>t1v[i_McpT]) & (v1Sig<t2v[i_McpT])]
-            v2 = v2Sig[(v2Sig>t1v[i_McpT]) & (v2Sig<t2v[i_McpT])]      
-            w1 = w1Sig[(w1Sig>t1w[i_McpT]) & (w1Sig<t2w[i_McpT])]
-            w2 = w2Sig[(w2Sig>t1w[i_McpT]) & (w2Sig<t2w[i_McpT])]                          
-            
-            u1u2_sum = u1[:,np.newaxis] + u2[np.newaxis,:] - 2*McpT 
-            v1v2_sum = v1[:,np.newaxis] + v2[np.newaxis,:] - 2*McpT 
-            w1w2_sum = w1[:,np.newaxis] + w2[np.newaxis,:] - 2*McpT 
-            
-            
-            u1_ind, u2_ind = np.where((u1u2_sum>self.uTSumLow) & (u1u2_sum<self.uTSumHigh))
-            v1_ind, v2_ind = np.where((v1v2_sum>self.vTSumLow) & (v1v2_sum<self.vTSumHigh))
-            w1_ind, w2_ind = np.where((w1w2_sum>self.wTSumLow) & (w1w2_sum<self.wTSumHigh))
-                    
-          
-            sum_u = u1[u1_ind]+u2[u2_ind] - 2*McpT - self.uTSumAvg
-            sum_v = v1[v1_ind]+v2[v2_ind] - 2*McpT - self.vTSumAvg 
-            sum_w = w1[w1_ind]+w2[w2_ind] - 2*McpT - self.wTSumAvg             
-            
-            if self.reconstruction_k_diag_tsum:
-                if sum_u.size > 0: self.list_dict['tsum_u'].append(self.pick_one(sum_u))
-                if sum_v.size > 0: self.list_dict['tsum_v'].append(self.pick_one(sum_v))
-                if sum_w.size > 0: self.list_dict['tsum_w'].append(self.pick_one(sum_w))
-                
-                # self.data_dict['tsum_u'] = np.concatenate([self.data_dict['tsum_u'], self.pick_one(sum_u)],axis=0)
-                # self.data_dict['tsum_v'] = np.concatenate([self.data_dict['tsum_v'], self.pick_one(sum_v)],axis=0)
-                # self.data_dict['tsum_w'] = np.concatenate([self.data_dict['tsum_w'], self.pick_one(sum_w)],axis=0)   
+        # first minimum of tsum_abs per MCP hit; lexsort is stable so ties keep the row-major order
+        order = np.lexsort((tsum_abs, i_uv))
+        i_sorted = i_uv[order]
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = i_sorted[1:] != i_sorted[:-1]
+        best = order[first]
 
-            
-            sub_u = u1[u1_ind]-u2[u2_ind]
-            sub_v = v1[v1_ind]-v2[v2_ind]
-            sub_w = w1[w1_ind]-w2[w2_ind]
-
-            if self.reconstruction_k_diag_diff:
-                if sub_u.size > 0: self.list_dict['diff_u'].append(self.pick_one(sub_u))
-                if sub_v.size > 0: self.list_dict['diff_v'].append(self.pick_one(sub_v))
-                if sub_w.size > 0: self.list_dict['diff_w'].append(self.pick_one(sub_w))
-                
-                # self.data_dict['diff_u'] = np.concatenate([self.data_dict['diff_u'], self.pick_one(sub_u)],axis=0)
-                # self.data_dict['diff_v'] = np.concatenate([self.data_dict['diff_v'], self.pick_one(sub_v)],axis=0)
-                # self.data_dict['diff_w'] = np.concatenate([self.data_dict['diff_w'], self.pick_one(sub_w)],axis=0)                
-            
-            sub_uf = (sub_u-self.u_diff_offset)*self.f_u/2
-            sub_vf = (sub_v-self.v_diff_offset)*self.f_v/2
-            sub_wf = (sub_w-self.w_diff_offset)*self.f_w/2
-                            
-            Xuv = sub_uf[:,np.newaxis] + 0*sub_vf[np.newaxis,:]
-            Yuv = (sub_uf[:,np.newaxis] - 2*sub_vf[np.newaxis,:])/self.sqrt3              
-            x = np.ravel(Xuv)
-            y = np.ravel(Yuv)
-
-            if len(x) > 0:
-                tsum_abs = np.abs(sum_u[:,np.newaxis]) + np.abs(sum_v[np.newaxis,:])
-                tsum_abs = np.ravel(tsum_abs)         
-                ind_min = np.argmin(tsum_abs)
-                x1, y1 = x[ind_min], y[ind_min]
-                rMCP2 = x1**2+y1**2              
-                if rMCP2<self.radius2:                    
-                    self.list_dict['x'].append(x1)
-                    self.list_dict['y'].append(y1)
-                    self.list_dict['t'].append(McpT)          
-
-        if self.reconstruction_k_diag_tsum: 
-            for k in ['tsum_u', 'tsum_v', 'tsum_w']:
-                self.data_dict[k] = np.array(self.list_dict[k])
-
-        if self.reconstruction_k_diag_diff: 
-            for k in ['diff_u', 'diff_v', 'diff_w']:
-                self.data_dict[k] = np.array(self.list_dict[k])        
-                           
-        for k in ['x', 'y', 't']:
-            self.data_dict[k] = np.array(self.list_dict[k])
-        
-        self.data_dict['n'] = np.array([len(self.data_dict['t'])])
+        x = sub_uf[pu[best]] + 0*sub_vf[pv[best]]
+        y = (sub_uf[pu[best]] - 2*sub_vf[pv[best]])/self.sqrt3
+        inside = (x**2+y**2) < self.radius2
 
+        self.data_dict['x'] = x[inside]
+        self.data_dict['y'] = y[inside]
+        self.data_dict['t'] = McpSig[i_uv[best][inside]]
+        self.data_dict['n'] = np.array([len(self.data_dict['t'])])
+        if e_mcp is not None:
+            self.data_dict['event'] = np.asarray(e_mcp)[i_uv[best][inside]]
+
+
+    def window_pairs(self, McpSig, sig1, sig2, t1, t2, tsum_low, tsum_high, e_mcp=None, e1=None, e2=None):
+        """
+        All (sig1, sig2) pairs inside the window (t1[i], t2[i]) of each MCP hit i whose
+        time sum relative to the MCP lies in (tsum_low, tsum_high).
+
+        Window bounds come from searchsorted on the sorted anode times, so no per-hit
+        masking of the full arrays is needed. Returns the MCP index of every pair and
+        the two anode times, grouped by MCP hit. With event indices `e_mcp`, `e1`,
+        `e2` the search runs on event*span + time, with a span wider than all times,
+        so a window never reaches into another event; the pairs keep their own times.
+        """
+        s1 = np.asarray(sig1, dtype=float)
+        s2 = np.asarray(sig2, dtype=float)
+        if e_mcp is None:
+            s1 = np.sort(s1)
+            s2 = np.sort(s2)
+            k1, k2, b1, b2 = s1, s2, t1, t2
+        else:
+            span = 2*max(np.abs(a).max(initial=0.) for a in (s1, s2, t1, t2)) + 1
+            o1 = np.lexsort((s1, e1))
+            o2 = np.lexsort((s2, e2))
+            s1, s2 = s1[o1], s2[o2]
+            k1, k2 = e1[o1]*span + s1, e2[o2]*span + s2
+            b1, b2 = e_mcp*span + t1, e_mcp*span + t2
+
+        lo1 = np.searchsorted(k1, b1, side='right')
+        lo2 = np.searchsorted(k2, b1, side='right')
+        n1 = np.maximum(np.searchsorted(k1, b2, side='left') - lo1, 0)
+        n2 = np.maximum(np.searchsorted(k2, b2, side='left') - lo2, 0)
+
+        n12 = n1*n2
+        i_mcp = np.repeat(np.arange(McpSig.size), n12)
+        k = np.arange(i_mcp.size) - np.repeat(np.cumsum(n12) - n12, n12)
+        n2_r = n2[i_mcp]
+        a = s1[lo1[i_mcp] + k//n2_r]
+        b = s2[lo2[i_mcp] + k%n2_r]
+
+        tsum = a + b - 2*McpSig[i_mcp]
+        valid = (tsum>tsum_low) & (tsum<tsum_high)
+        return i_mcp[valid], a[valid], b[valid]
+
+
+    def combinations_per_hit(self, i1, i2, n_hits):
+        # cartesian product of two grouped index sets, restricted to equal MCP hit
+        c1 = np.bincount(i1, minlength=n_hits)
+        c2 = np.bincount(i2, minlength=n_hits)
+        s1 = np.cumsum(c1) - c1
+        s2 = np.cumsum(c2) - c2
+        n12 = c1*c2
+        i_hit = np.repeat(np.arange(n_hits), n12)
+        k = np.arange(i_hit.size) - np.repeat(np.cumsum(n12) - n12, n12)
+        c2_r = c2[i_hit]
+        return i_hit, s1[i_hit] + k//c2_r, s2[i_hit] + k%c2_r
+
+
+    def pick_one_per_hit(self, i_hit, arr, n_hits):
+        # one random element per MCP hit that has at least one candidate
+        counts = np.bincount(i_hit, minlength=n_hits)
+        starts = np.cumsum(counts) - counts
+        has = counts > 0
+        return arr[starts[has] + (np.random.random(has.sum())*counts[has]).astype(int)]
 
     
     def pick_one(self, arr):
@@ -1,12 +1,12 @@
 import os
 import numpy as np
 from dream.alg.common.peak_finders import hsd_peak_finder
-from dream.lib.libASort import PyASort
 from dream.util.misc import read_config, lists_intersection
 from itertools import combinations
+from .sorter import load_sorter, SETTING_NAMES
 
 class dld_reconstructor:
-    def __init__(self, det_id, requested_vars, rank, **kwargs):
+    def __init__(self, det_id, requested_vars, rank, sorter='asort', **kwargs):
 
         self.det_id = det_id
         self.sign_z = 1. if self.det_id == 's' else -1.
@@ -17,6 +17,7 @@ class dld_reconstructor:
         if rank==0:
             print('DET ID: ', self.det_id)
             print('ALG: ', 'dld')
+            print('SORTER: ', sorter)
             print('CONFIG:')
             print(self.params)  
 
@@ -32,9 +33,8 @@ class dld_reconstructor:
                 
         self.peak_finder = hsd_peak_finder(self.det_id, self.sig_names, self.mapping, self.params['det'], requested_vars)
 
-        setting_names = ['pos_offset_x', 'pos_offset_y', 'tsum_hw_u', 'tsum_hw_v', 'tsum_hw_w', 'f_u', 'f_v', 'f_w', 'w_offset', 'runtime_u', 'runtime_v', 'runtime_w', 'rMCP', 'dtime_dld', 'dtime_mcp', 'mth_max']
-        settings = [self.params['hr'][setting_name] for setting_name in setting_names]
-        self.RHF = PyASort()
+        settings = [self.params['hr'][setting_name] for setting_name in SETTING_NAMES]
+        self.RHF = load_sorter(sorter)
         s_corr, p_corr = 1, 1
         _ = self.RHF.init_sorter(config_dir, self.det_id, 0, 1, s_corr, p_corr, *settings)
     
@@ -110,6 +110,9 @@ class dld_reconstructor:
             #if len(lists_intersection(self.avail_vars_tp, requested_vars[self.k_tp])) > 0:
             self.tripico = True      
             self.reconstruction = True
+
+        # hits are sorted whenever hit_, ppc_ or tpc_ variables are requested
+        self.sorting = self.reconstruction_k0 or self.pipico or self.tripico
         
         self.data_dict = {}
        
@@ -118,140 +121,184 @@ class dld_reconstructor:
         self.data_dict = {}
         self.reconstruct(*args, **kwargs)
         return self.data_dict
-        
+
+    def process_batch(self, det, events):
+        """
+        __call__ for several events: the peak finder runs one CFD pass per channel
+        over the FEX windows of all of them and a sorter with sort_events (numpy)
+        sorts all their peaks in one pass. Returns the per-event outputs.
+        """
+        if not self.peak_finder.params['fex']:
+            return [self(det, evt) for evt in events]
+
+        outs = self.peak_finder.find_peaks_events(det, events)
+        if not self.requested_peak_finder_data:
+            outs = [{} for _ in events]
+        if not self.reconstruction:
+            return outs
+
+        pf = self.peak_finder
+        n = len(events)
+        counts = {sig_name: pf.event_counts.get(sig_name, np.zeros(n, dtype=int)) for sig_name in self.sig_names}
+        peaks = {sig_name: pf.event_tpks.get(sig_name, np.empty((0,), dtype=float)) - self.sig_offset_dict[sig_name]
+                 for sig_name in self.sig_names}
+        total = sum(counts.values())
+        sorted_evt = pf.event_exist & (total <= self.hits_thresh) if self.reconstruction_k0 else pf.event_exist
+
+        batched = hasattr(self.RHF, 'sort_events')
+        if batched and sorted_evt.any():
+            # only the events that are sorted go into the sorter
+            keep = {sig_name: np.repeat(sorted_evt, counts[sig_name]) for sig_name in self.sig_names}
+            peaks_s = {sig_name: peaks[sig_name][keep[sig_name]] for sig_name in self.sig_names}
+            counts_s = {sig_name: counts[sig_name][sorted_evt] for sig_name in self.sig_names}
+            rows = np.cumsum(sorted_evt) - 1
+            if self.reconstruction_k_diag:
+                diff_tsum = self.RHF.pos_tsum_events(peaks_s, counts_s)
+            if self.sorting:
+                hit_evt = self.RHF.sort_events(peaks_s, counts_s)
+                hit_lo = np.searchsorted(hit_evt, np.arange(sorted_evt.sum()))
+                hit_hi = np.r_[hit_lo[1:], hit_evt.size]
+                hits = (self.RHF.get_hits_x(), self.RHF.get_hits_y(), self.RHF.get_hits_t(), self.RHF.get_hits_method())
+
+        offsets = {sig_name: np.r_[0, np.cumsum(counts[sig_name])] for sig_name in self.sig_names}
+        for i in range(n):
+            self.data_dict = outs[i]
+            if not pf.event_exist[i]:
+                self.no_peaks_output()
+            elif not sorted_evt[i]:
+                self.overflow_output()
+            elif not batched:
+                tpks = {sig_name: peaks[sig_name][offsets[sig_name][i]:offsets[sig_name][i+1]] for sig_name in self.sig_names}
+                self.sort_peaks(tpks)
+            else:
+                r = rows[i]
+                if self.reconstruction_k_diag:
+                    d = diff_tsum[r]
+                    self.diag_output(None if np.isnan(d[0]) else d)
+                if self.sorting:
+                    sl = slice(hit_lo[r], hit_hi[r])
+                    self.hits_output(*[h[sl] for h in hits])
+        return outs
+
     def reconstruct(self, det, evt, *args, **kwargs):
 
         self.peak_finder(det, evt)
         if self.requested_peak_finder_data: self.data_dict.update(self.peak_finder.data_dict)
 
-        if self.reconstruction:
-
-            len_peaks = 0
-            if self.peak_finder.peak_exist:
-                ks = self.peak_finder.tpks_dict.keys()
-                if len(ks) != 7:
-                    for sig_name in self.sig_names:
-                        if sig_name not in ks:
-                            self.peak_finder.tpks_dict[sig_name] = np.array([])
-                            self.peak_finder.len_tpks_dict[sig_name] = 0
-                            
-                for sig_name in self.sig_names: 
-                    len_peaks += (len(self.peak_finder.tpks_dict[sig_name]))                                                  
-
-                if len_peaks > self.hits_thresh: 
-                    self.data_dict[self.k0] = {}
-                    if self.requested['n']: self.data_dict[self.k0]['n'] = np.array([np.nan])
-                    for var in ['z', 'y', 't', 'm']:
-                        if self.requested[var]: self.data_dict[self.k0][var] = np.array([])  
-
-                    if self.pipico:
-                        self.data_dict[self.k_pp] = {}
-                        for var in ['pp1', 'pp2']:
-                            self.data_dict[self.k_pp][var] = np.array([])  
-
-                    if self.tripico:
-                        self.data_dict[self.k_tp] = {}
-                        for var in ['tp1', 'tp2', 'tp3']:
-                            self.data_dict[self.k_tp][var] = np.array([])         
-
-                    if self.reconstruction_k_diag:
-                        self.data_dict[self.k_diag] = {}
-                        for k_diff_sum in self.diff_sum_index.keys():
-                            if self.requested[k_diff_sum]: self.data_dict[self.k_diag][k_diff_sum] = np.array([np.nan])                    
-                            
-                    return
-
-                for sig_name in self.sig_names:                    
-                    self.RHF.set_peaks_arr(sig_name, 
-                                           self.peak_finder.tpks_dict[sig_name] - self.sig_offset_dict[sig_name], 
-                                           self.peak_finder.len_tpks_dict[sig_name])              
-                    
-                self.RHF.pre_sort()  
+        if not self.reconstruction:
+            return
+        if not self.peak_finder.peak_exist:
+            self.no_peaks_output()
+            return
 
-                if self.reconstruction_k_diag:
-                    self.data_dict[self.k_diag] = {}
-                    pt_ready = self.RHF.pos_tsum_ready()
-                 
-                    if pt_ready:
-                        diff_tsum = self.RHF.get_pos_tsum()
-                
-                        for k_diff_sum in self.diff_sum_index.keys():
-                            if self.requested[k_diff_sum]: self.data_dict[self.k_diag][k_diff_sum] = np.array([diff_tsum[self.diff_sum_index[k_diff_sum]]])
-                    else:
-                        for k_diff_sum in self.diff_sum_index.keys():
-                            if self.requested[k_diff_sum]: self.data_dict[self.k_diag][k_diff_sum] = np.array([np.nan])                     
-                        
-
-                if self.reconstruction_k0:
-                    self.data_dict[self.k0] = {}
-                    self.RHF.sort()     
-                    self.RHF.fill_hits()                                  
-                    hits_n = self.RHF.get_hits_n()
-     
-                    if self.requested['n']: self.data_dict[self.k0]['n'] = np.array([hits_n])
-                    if self.requested['z']: self.data_dict[self.k0]['z'] = self.sign_z*self.RHF.get_hits_y()
-                    if self.requested['y']: self.data_dict[self.k0]['y'] = self.RHF.get_hits_x()
-                    if self.requested['t']: self.data_dict[self.k0]['t'] = self.RHF.get_hits_t()
-                    if self.requested['m']: self.data_dict[self.k0]['m'] = self.RHF.get_hits_method()
+        ks = self.peak_finder.tpks_dict.keys()
+        if len(ks) != 7:
+            for sig_name in self.sig_names:
+                if sig_name not in ks:
+                    self.peak_finder.tpks_dict[sig_name] = np.array([])
+                    self.peak_finder.len_tpks_dict[sig_name] = 0
 
+        len_peaks = 0
+        for sig_name in self.sig_names:
+            len_peaks += (len(self.peak_finder.tpks_dict[sig_name]))
 
-                    
-                    
-                if self.pipico:
-                    self.data_dict[self.k_pp] = {}
-                    if hits_n>1:
-                        # partitioned = np.partition(self.RHF.get_hits_t(), 1)
-                        # pps = np.sort(partitioned[:2])
-                        # self.data_dict[self.k_pp]['pp1'] = np.array([pps[0]])
-                        # self.data_dict[self.k_pp]['pp2'] = np.array([pps[1]]) 
-                        
-                        pairs = np.array(list(combinations(self.RHF.get_hits_t(), 2)))
-                        self.data_dict[self.k_pp]['pp1'] = pairs[:,0]
-                        self.data_dict[self.k_pp]['pp2'] = pairs[:,1]    
-    
-                
-                    else:
-                        for var in ['pp1', 'pp2']:
-                            self.data_dict[self.k_pp][var] = np.array([])  
-                
+        if self.reconstruction_k0 and len_peaks > self.hits_thresh:
+            self.overflow_output()
+            return
 
-                if self.tripico:
-                    self.data_dict[self.k_tp] = {}
-                    if hits_n>2:
-                        partitioned = np.partition(self.RHF.get_hits_t(), 2)
-                        tps = np.sort(partitioned[:3])
-                        self.data_dict[self.k_tp]['tp1'] = np.array([tps[0]])
-                        self.data_dict[self.k_tp]['tp2'] = np.array([tps[1]])     
-                        self.data_dict[self.k_tp]['tp3'] = np.array([tps[2]])   
+        self.sort_peaks({sig_name: self.peak_finder.tpks_dict[sig_name] - self.sig_offset_dict[sig_name]
+                         for sig_name in self.sig_names})
 
-                    else:
-                        for var in ['tp1', 'tp2', 'tp3']:
-                            self.data_dict[self.k_tp][var] = np.array([])              
+    def sort_peaks(self, tpks):
+        # one event through the sorter; `tpks` are offset-corrected peak times per channel
+        for sig_name in self.sig_names:
+            self.RHF.set_peaks_arr(sig_name, tpks[sig_name], np.array([len(tpks[sig_name])]))
 
-            
+        self.RHF.pre_sort()
+
+        if self.reconstruction_k_diag:
+            self.diag_output(self.RHF.get_pos_tsum() if self.RHF.pos_tsum_ready() else None)
+
+        if self.sorting:
+            self.RHF.sort()
+            self.RHF.fill_hits()
+            self.hits_output(self.RHF.get_hits_x(), self.RHF.get_hits_y(), self.RHF.get_hits_t(), self.RHF.get_hits_method())
+
+    def diag_output(self, diff_tsum):
+        self.data_dict[self.k_diag] = {}
+        for k_diff_sum in self.diff_sum_index.keys():
+            if self.requested[k_diff_sum]:
+                v = np.nan if diff_tsum is None else diff_tsum[self.diff_sum_index[k_diff_sum]]
+                self.data_dict[self.k_diag][k_diff_sum] = np.array([v])
+
+    def hits_output(self, x, y, t, m):
+        hits_n = t.size
+        if self.reconstruction_k0:
+            self.data_dict[self.k0] = {}
+            if self.requested['n']: self.data_dict[self.k0]['n'] = np.array([hits_n])
+            if self.requested['z']: self.data_dict[self.k0]['z'] = self.sign_z*y
+            if self.requested['y']: self.data_dict[self.k0]['y'] = x
+            if self.requested['t']: self.data_dict[self.k0]['t'] = t
+            if self.requested['m']: self.data_dict[self.k0]['m'] = m
+
+        if self.pipico:
+            self.data_dict[self.k_pp] = {}
+            if hits_n>1:
+                pairs = np.array(list(combinations(t, 2)))
+                self.data_dict[self.k_pp]['pp1'] = pairs[:,0]
+                self.data_dict[self.k_pp]['pp2'] = pairs[:,1]
             else:
-                if self.reconstruction_k0:
-                    self.data_dict[self.k0] = {}
-                    if self.requested['n']: self.data_dict[self.k0]['n'] = np.array([0])
-                    for var in ['z', 'y', 't', 'm']:
-                        if self.requested[var]: self.data_dict[self.k0][var] = np.array([])  
+                for var in ['pp1', 'pp2']:
+                    self.data_dict[self.k_pp][var] = np.array([])
+
+        if self.tripico:
+            self.data_dict[self.k_tp] = {}
+            if hits_n>2:
+                partitioned = np.partition(t, 2)
+                tps = np.sort(partitioned[:3])
+                self.data_dict[self.k_tp]['tp1'] = np.array([tps[0]])
+                self.data_dict[self.k_tp]['tp2'] = np.array([tps[1]])
+                self.data_dict[self.k_tp]['tp3'] = np.array([tps[2]])
+            else:
+                for var in ['tp1', 'tp2', 'tp3']:
+                    self.data_dict[self.k_tp][var] = np.array([])
+
+    def overflow_output(self):
+        # more peaks than max_hits allows: nan counts and empty hits
+        self.data_dict[self.k0] = {}
+        if self.requested['n']: self.data_dict[self.k0]['n'] = np.array([np.nan])
+        for var in ['z', 'y', 't', 'm']:
+            if self.requested[var]: self.data_dict[self.k0][var] = np.array([])
+
+        if self.pipico:
+            self.data_dict[self.k_pp] = {}
+            for var in ['pp1', 'pp2']:
+                self.data_dict[self.k_pp][var] = np.array([])
+
+        if self.tripico:
+            self.data_dict[self.k_tp] = {}
+            for var in ['tp1', 'tp2', 'tp3']:
+                self.data_dict[self.k_tp][var] = np.array([])
 
-                if self.pipico:
-                    self.data_dict[self.k_pp] = {}
-                    for var in ['pp1', 'pp2']:
-                        self.data_dict[self.k_pp][var] = np.array([])  
+        if self.reconstruction_k_diag:
+            self.diag_output(None)
 
-                if self.tripico:
-                    self.data_dict[self.k_tp] = {}
-                    for var in ['tp1', 'tp2', 'tp3']:
-                        self.data_dict[self.k_tp][var] = np.array([])    
+    def no_peaks_output(self):
+        if self.reconstruction_k0:
+            self.data_dict[self.k0] = {}
+            if self.requested['n']: self.data_dict[self.k0]['n'] = np.array([0])
+            for var in ['z', 'y', 't', 'm']:
+                if self.requested[var]: self.data_dict[self.k0][var] = np.array([])
 
+        if self.pipico:
+            self.data_dict[self.k_pp] = {}
+            for var in ['pp1', 'pp2']:
+                self.data_dict[self.k_pp][var] = np.array([])
 
-                if self.reconstruction_k_diag:
-                    self.data_dict[self.k_diag] = {}
-                    for k_diff_sum in self.diff_sum_index.keys():
-                        if self.requested[k_diff_sum]: self.data_dict[self.k_diag][k_diff_sum] = np.array([np.nan])
-     
+        if self.tripico:
+            self.data_dict[self.k_tp] = {}
+            for var in ['tp1', 'tp2', 'tp3']:
+                self.data_dict[self.k_tp][var] = np.array([])
 
-                    
-                      
+        if self.reconstruction_k_diag:
+            self.diag_output(None)
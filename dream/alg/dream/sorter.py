@@ -0,0 +1,160 @@
+import warnings
+import numpy as np
+from typing import Protocol
+from .HitFinder import HitFinder
+
+# positional settings passed to init_sorter after (config_dir, det_id, 0, 1, s_corr, p_corr)
+SETTING_NAMES = ['pos_offset_x', 'pos_offset_y', 'tsum_hw_u', 'tsum_hw_v', 'tsum_hw_w', 'f_u', 'f_v', 'f_w', 'w_offset',
+                 'runtime_u', 'runtime_v', 'runtime_w', 'rMCP', 'dtime_dld', 'dtime_mcp', 'mth_max']
+
+SORTER_BACKENDS = ['asort', 'numpy']
+
+
+class Sorter(Protocol):
+    """
+    Sorter interface used by dld_reconstructor, mirroring PyASort:
+    init_sorter -> set_peaks_arr (per channel) -> pre_sort -> [pos_tsum_ready, get_pos_tsum]
+    -> sort -> fill_hits -> get_hits_n/x/y/t/method.
+    """
+    def init_sorter(self, config_dir, det_id, *args): ...
+    def set_peaks_arr(self, sig_name, peaks, n_peaks): ...
+    def pre_sort(self): ...
+    def pos_tsum_ready(self): ...
+    def get_pos_tsum(self): ...
+    def sort(self): ...
+    def fill_hits(self): ...
+    def get_hits_n(self): ...
+    def get_hits_x(self): ...
+    def get_hits_y(self): ...
+    def get_hits_t(self): ...
+    def get_hits_method(self): ...
+
+
+def load_sorter(backend='asort') -> Sorter:
+    """
+    Return a DLD sorter instance for `backend` ('asort' or 'numpy').
+
+    'asort' uses the compiled PyASort from dream/lib and falls back to the numpy
+    sorter, with a warning on every rank, when the extension cannot be imported
+    (e.g. other Python versions). See NumpySorter for what that changes.
+    """
+    if backend not in SORTER_BACKENDS:
+        raise ValueError(f"Unknown sorter backend '{backend}', expected one of {SORTER_BACKENDS}")
+    if backend == 'asort':
+        try:
+            from dream.lib.libASort import PyASort
+        except ImportError as err:
+            warnings.warn(f"libASort unavailable ({err}), falling back to the numpy sorter: "
+                          "hits are found from the u and v layers only, every hit has method 0 "
+                          "and no time-sum/position corrections are applied", RuntimeWarning)
+        else:
+            return PyASort()
+    return NumpySorter()
+
+
+class NumpySorter:
+    """
+    Vectorized NumPy sorter built on HitFinder.
+
+    dld_reconstructor shifts every anode by its tsum/diff offset before
+    set_peaks_arr, so the hit finder runs with zero time-sum averages and diff
+    offsets. Positions come from the u and v layers, the w layer only feeds the
+    pos/tsum diagnostics. There is no reconstruction-method classification
+    (get_hits_method is 0 for every hit) and the s_corr/p_corr time-sum and
+    position corrections of init_sorter are not applied.
+    """
+    sig_names = ['mcp', 'u1', 'u2', 'v1', 'v2', 'w1', 'w2']
+
+    def __init__(self):
+        self.finder = None
+        self.pos_offset_x = 0.
+        self.pos_offset_y = 0.
+        self.peaks = {}
+        self.hits = {}
+
+    def init_sorter(self, config_dir, det_id, *args):
+        settings = dict(zip(SETTING_NAMES, args[4:]))
+        params = {'rMCP': settings['rMCP']}
+        for k in ['u', 'v', 'w']:
+            params['runtime_'+k] = settings['runtime_'+k]
+            params['f_'+k] = settings['f_'+k]
+            params['tsum_hw_'+k] = settings['tsum_hw_'+k]
+            params['tsum_avg_'+k] = 0.
+            params[k+'_diff_offset'] = 0.
+        self.finder = HitFinder(params)
+        self.pos_offset_x = settings['pos_offset_x']
+        self.pos_offset_y = settings['pos_offset_y']
+        return 0
+
+    def set_peaks_arr(self, sig_name, peaks, n_peaks):
+        self.peaks[sig_name] = np.asarray(peaks, dtype=float)[:int(np.ravel(n_peaks)[0])]
+
+    def pre_sort(self):
+        self.hits = {}
+        for sig_name in self.sig_names:
+            if sig_name not in self.peaks: self.peaks[sig_name] = np.empty((0,), dtype=float)
+
+    def pos_tsum_ready(self):
+        return all(self.peaks[sig_name].size > 0 for sig_name in self.sig_names)
+
+    def get_pos_tsum(self):
+        # diff/tsum of the first peak on each layer, relative to the first MCP peak
+        mcp = self.peaks['mcp'][0]
+        out = []
+        for k in ['u', 'v', 'w']:
+            s1, s2 = self.peaks[k+'1'][0], self.peaks[k+'2'][0]
+            out += [s1 - s2, s1 + s2 - 2*mcp]
+        return np.array(out)
+
+    def sort(self):
+        p = self.peaks
+        self.finder.FindHits(p['mcp'], p['u1'], p['u2'], p['v1'], p['v2'], p['w1'], p['w2'])
+
+    def fill_hits(self):
+        d = self.finder.data_dict
+        self.hits = {'x': d['x'] + self.pos_offset_x, 'y': d['y'] + self.pos_offset_y, 't': d['t']}
+
+    def sort_events(self, peaks, counts):
+        """
+        Sort several events in one HitFinder pass. `peaks[sig_name]` holds the
+        peaks of all events back to back, `counts[sig_name]` how many of them each
+        event has. Fills the hits of all events and returns the event of every hit.
+        """
+        events = [np.repeat(np.arange(len(counts[sig_name])), counts[sig_name]) for sig_name in self.sig_names]
+        self.finder.FindHits(*[peaks[sig_name] for sig_name in self.sig_names], events=events)
+        self.fill_hits()
+        return self.finder.data_dict['event']
+
+    def pos_tsum_events(self, peaks, counts):
+        """get_pos_tsum of every event of a sort_events batch; rows of events that are not ready are nan."""
+        first = {}
+        ready = np.ones(len(counts['mcp']), dtype=bool)
+        for sig_name in self.sig_names:
+            c = counts[sig_name]
+            ready &= c > 0
+            first[sig_name] = np.full(c.size, np.nan)
+            start = np.cumsum(c) - c
+            first[sig_name][c > 0] = peaks[sig_name][start[c > 0]]
+        mcp = first['mcp']
+        out = []
+        for k in ['u', 'v', 'w']:
+            s1, s2 = first[k+'1'], first[k+'2']
+            out += [s1 - s2, s1 + s2 - 2*mcp]
+        out = np.stack(out, axis=1)
+        out[~ready] = np.nan
+        return out
+
+    def get_hits_n(self):
+        return self.hits['t'].size
+
+    def get_hits_x(self):
+        return self.hits['x']
+
+    def get_hits_y(self):
+        return self.hits['y']
+
+    def get_hits_t(self):
+        return self.hits['t']
+
+    def get_hits_method(self):
+        return np.zeros(self.hits['t'].size)
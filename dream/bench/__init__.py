@@ -0,0 +1,7 @@
+"""
+Throughput benchmarks for the processing stages (peak finding, hit reconstruction,
+worker histograms, gatherer accumulation, offline writer) driven by synthetic events.
+
+    python -m dream.bench --events 2000 --save base.json
+    python -m dream.bench --events 2000 --compare base.json
+"""
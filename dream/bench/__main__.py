@@ -0,0 +1,61 @@
+import os
+import sys
+import platform
+import argparse
+
+
+def read_args():
+    parser = argparse.ArgumentParser(description='dream throughput benchmarks')
+    parser.add_argument('--events', metavar='N', type=int, default=2000, help='number of synthetic events')
+    parser.add_argument('--hits', metavar='H', type=float, default=5, help='mean hits per event')
+    parser.add_argument('--seed', metavar='S', type=int, default=0, help='synthetic seed')
+    parser.add_argument('--steps', metavar='N', type=int, default=10, help='number of scan steps')
+    parser.add_argument('--nacc', metavar='N', type=int, default=5, help='events per worker flush')
+    parser.add_argument('--repeat', metavar='N', type=int, default=3, help='timed repetitions (best is kept)')
+    parser.add_argument('-k', '--cases', metavar='PATTERN', type=str, default=None,
+                        help='only run cases whose name contains one of the comma separated patterns')
+    parser.add_argument('--list', action='store_true', help='list the cases and exit')
+    parser.add_argument('--save', metavar='FILE', type=str, default=None, help='save results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', type=str, default=None, help='compare against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative drop in events/s reported as a regression (default 0.1)')
+    return parser.parse_args()
+
+
+def main():
+    args = read_args()
+    from dream.bench import runner, cases as bench_cases
+
+    if os.getenv('CONFIGDIR') is None:
+        os.environ['CONFIGDIR'] = bench_cases.default_config_dir()
+
+    cases = bench_cases.all_cases()
+    if args.cases:
+        patterns = args.cases.split(',')
+        cases = [c for c in cases if any(p in c.name for p in patterns)]
+    if args.list:
+        for c in cases: print(c.name)
+        return 0
+
+    print(f"generating {args.events} synthetic events ({args.hits} hits/event) ...")
+    ev = bench_cases.events_bundle(args.events, args.hits, args.seed, args.steps, args.nacc)
+    print(f"{ev.n_mcp} mcp hits, {ev.n_hits} reconstructed hits\n")
+
+    print(runner.header())
+    results = runner.run_cases(cases, ev, repeat=args.repeat)
+
+    if args.save:
+        meta = {'events': args.events, 'hits': args.hits, 'seed': args.seed, 'nacc': args.nacc,
+                'python': platform.python_version(), 'machine': platform.machine()}
+        runner.save(results, args.save, meta)
+        print(f"\nsaved {args.save}")
+
+    if args.compare:
+        print()
+        if runner.compare(results, runner.load(args.compare), args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
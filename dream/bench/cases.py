@@ -0,0 +1,426 @@
+import os
+import numpy as np
+from dream.bench.runner import Case
+
+DET_ID = 'l'
+SIG_NAMES = ['mcp', 'u1', 'u2', 'v1', 'v2', 'w1', 'w2']
+# the gather kernels take microseconds per flush, time them often enough for a stable best-of
+GATHER_REPEAT = 200
+
+
+def default_config_dir():
+    import dream
+    return os.path.join(os.path.dirname(dream.__file__), 'config') + os.sep
+
+
+class recorded_raw:
+    """Replays detector reads recorded from the synthetic source; events are indices."""
+    def __init__(self):
+        self.frames = []
+        self.raw = self
+
+    def peaks(self, evt):
+        return self.frames[evt]['peaks']
+
+    def fex_status(self, evt):
+        return self.frames[evt]['fex_status']
+
+
+class events_bundle:
+    """
+    Inputs shared by all cases, generated once: recorded FEX reads, the model hits
+    (offset-corrected, as handed to the sorters), reconstructed hits and x values.
+    """
+    def __init__(self, n_events, hits, seed, steps, nacc):
+        from dream.util import synthetic
+        from dream.util.misc import read_config
+        self.n_events = n_events
+        self.nacc = nacc
+        ds = synthetic.DataSource(run=1, synthetic={'events': n_events, 'hits': hits, 'seed': seed, 'steps': steps})
+        run = next(ds.runs())
+        self.params = read_config(os.getenv('CONFIGDIR') + 'dream/alg.yaml')[DET_ID]
+        hr = self.params['hr']
+
+        self.offsets = {'mcp': 0.}
+        for k in 'uvw':
+            self.offsets[k+'1'] = (hr['tsum_avg_'+k] + hr[k+'_diff_offset'])/2
+            self.offsets[k+'2'] = (hr['tsum_avg_'+k] - hr[k+'_diff_offset'])/2
+
+        names = list(self.params['det']['keys'])
+        sources = {k: run.Detector(k) for k in names}
+        self.dets = {k: recorded_raw() for k in names}
+        self.tpks = []
+        self.x = []
+        timing, gmd, scan = run.Detector('timing'), run.Detector('gmd'), run.Detector('lxt')
+        for evt in run.events():
+            for k in names:
+                self.dets[k].frames.append({'peaks': sources[k].raw.peaks(evt), 'fex_status': sources[k].raw.fex_status(evt)})
+            hits_evt = run.model.hits(evt, DET_ID)
+            self.tpks.append({s: hits_evt[s] - self.offsets[s] for s in SIG_NAMES})
+            codes = timing.raw.eventcodes(evt)
+            self.x.append({'timestamp': evt.timestamp, 'timing:280': codes[280], 'timing:281': codes[281],
+                           'timing:dest': timing.raw.destination(evt), 'bld:gmd': gmd.raw.milliJoulesPerPulse(evt),
+                           'scan:var1': scan(evt)})
+        self.n_mcp = sum(t['mcp'].size for t in self.tpks)
+
+        from dream.alg.dream.HitFinder import HitFinder
+        hf = HitFinder(hit_finder_params(hr))
+        self.hits = []
+        for t in self.tpks:
+            hf.FindHits(*[t[s] for s in SIG_NAMES])
+            self.hits.append({'t': hf.data_dict['t'], 'y': hf.data_dict['x'], 'z': -hf.data_dict['y'],
+                              'n': hf.data_dict['n']})
+        self.n_hits = sum(h['t'].size for h in self.hits)
+
+    def chunks(self):
+        # per-flush worker inputs: concatenated hits of nacc events plus the per-event x values
+        out = []
+        for i in range(0, self.n_events, self.nacc):
+            hits = self.hits[i:i+self.nacc]
+            x = self.x[i:i+self.nacc]
+            out.append({
+                't': np.concatenate([h['t'] for h in hits]),
+                'y': np.concatenate([h['y'] for h in hits]),
+                'z': np.concatenate([h['z'] for h in hits]),
+                'n': np.array([h['n'][0] for h in hits], dtype=float),
+                'counts': np.array([h['t'].size for h in hits]),
+                'scan': np.array([v['scan:var1'] for v in x]),
+                'gmd': np.array([v['bld:gmd'] for v in x]),
+            })
+        return out
+
+
+def hit_finder_params(hr):
+    # the sorters get offset-corrected times, so averages and diff offsets are zero
+    params = dict(hr)
+    for k in 'uvw':
+        params['tsum_avg_'+k] = 0.
+        params[k+'_diff_offset'] = 0.
+    return params
+
+
+#### reconstruction
+
+def setup_cfd(ev):
+    finder = make_peak_finder(ev, fex_batch=False)
+    windows = []
+    for k1, det in ev.dets.items():
+        for frame in det.frames:
+            for k2, pk in frame['peaks'].items():
+                f = finder.finder[finder.mapping[k1+str(k2)]]
+                for start, amp in zip(*pk[0]):
+                    ts = (start + np.arange(len(amp)))*finder.fex_dt
+                    windows.append((f, amp.astype(float), ts))
+    return ev, windows
+
+
+def run_cfd(state):
+    ev, windows = state
+    n = 0
+    for f, amp, ts in windows:
+        n += f(amp, ts).size
+    return ev.n_events, n
+
+
+def make_peak_finder(ev, fex_batch):
+    from dream.alg.common.peak_finders import hsd_peak_finder
+    mapping = {}
+    for k1, vals in ev.params['det']['keys'].items():
+        layer = k1.split('_')[-1][1:]
+        for j, k2 in enumerate(vals):
+            mapping[k1+k2] = 'mcp' if layer == 'mcp' else layer+str(j+1)
+    params = dict(ev.params['det'], fex_batch=fex_batch)
+    return hsd_peak_finder(DET_ID, SIG_NAMES, mapping, params, {'tpks_'+DET_ID: SIG_NAMES})
+
+
+def setup_peak_finder(fex_batch):
+    def setup(ev):
+        return ev, make_peak_finder(ev, fex_batch)
+    return setup
+
+
+def run_peak_finder(state):
+    ev, finder = state
+    n = 0
+    for i in range(ev.n_events):
+        finder(ev.dets, i)
+        n += finder.tpks_dict['mcp'].size if 'mcp' in finder.tpks_dict else 0
+    return ev.n_events, n
+
+
+def setup_hit_finder(ev):
+    from dream.alg.dream.HitFinder import HitFinder
+    return ev, HitFinder(hit_finder_params(ev.params['hr']))
+
+
+def run_hit_finder(state):
+    ev, hf = state
+    for t in ev.tpks:
+        hf.FindHits(t['mcp'], t['u1'], t['u2'], t['v1'], t['v2'], t['w1'], t['w2'])
+    return ev.n_events, ev.n_mcp
+
+
+def setup_dld(module, **kwargs):
+    def setup(ev):
+        import importlib
+        alg = importlib.import_module(module).dld_reconstructor(DET_ID, {'hit_'+DET_ID: ['n', 'z', 'y', 't']}, rank=1, **kwargs)
+        return ev, alg
+    return setup
+
+
+def run_dld(state):
+    ev, alg = state
+    for i in range(ev.n_events):
+        alg(ev.dets, i)
+    return ev.n_events, ev.n_mcp
+
+
+def run_dld_batch(batch_events):
+    def run(state):
+        ev, alg = state
+        for lo in range(0, ev.n_events, batch_events):
+            alg.process_batch(ev.dets, list(range(lo, min(lo + batch_events, ev.n_events))))
+        return ev.n_events, ev.n_mcp
+    return run
+
+
+#### worker histograms (one call per flush of nacc events)
+
+def setup_chunks(ev):
+    return ev, ev.chunks()
+
+
+def run_hist1d(state):
+    from dream.util.histogram import worker_sparse_hist1d_fast
+    ev, chunks = state
+    edges = np.arange(0, 15000, 1)
+    for c in chunks:
+        worker_sparse_hist1d_fast(c['t'], edges)
+    return ev.n_events, ev.n_hits
+
+
+def run_hist2d(state):
+    from dream.util.histogram import worker_sparse_hist2d_fast
+    ev, chunks = state
+    xedges, yedges = np.arange(-65, 65, 2), np.arange(-65, 65, 2)
+    for c in chunks:
+        worker_sparse_hist2d_fast(c['y'], c['z'], xedges, yedges)
+    return ev.n_events, ev.n_hits
+
+
+def run_mean_sort(state):
+    from dream.util.histogram import worker_sparse_mean_sort
+    ev, chunks = state
+    for c in chunks:
+        worker_sparse_mean_sort(c['n'], c['scan'], 5, c['gmd'])
+    return ev.n_events, ev.n_hits
+
+
+def run_group_aggregate(state):
+    from dream.util.histogram import worker_group_aggregate
+    ev, chunks = state
+    for c in chunks:
+        worker_group_aggregate(c['n'], c['scan'], 5, c['gmd'])
+    return ev.n_events, ev.n_hits
+
+
+def run_mean_sort2d(state):
+    from dream.util.histogram import worker_sparse_mean_sort2d
+    ev, chunks = state
+    for c in chunks:
+        worker_sparse_mean_sort2d(c['n'], c['scan'], c['gmd'].round(1), 5, 5)
+    return ev.n_events, ev.n_hits
+
+
+def run_sort1d(state):
+    from dream.util.histogram import worker_sparse_sort1d_fast
+    ev, chunks = state
+    edges = np.arange(0, 15000, 5)
+    for c in chunks:
+        worker_sparse_sort1d_fast(c['t'], np.repeat(c['scan'], c['counts']), edges)
+    return ev.n_events, ev.n_hits
+
+
+def run_hist1d_engine(state):
+    from dream.util.histogram import worker_hist1d
+    ev, chunks = state
+    edges = np.arange(0, 15000, 1)
+    for c in chunks:
+        worker_hist1d(c['t'], edges)
+    return ev.n_events, ev.n_hits
+
+
+def run_hist2d_engine(state):
+    from dream.util.histogram import worker_hist2d
+    ev, chunks = state
+    xedges, yedges = np.arange(-65, 65, 2), np.arange(-65, 65, 2)
+    for c in chunks:
+        worker_hist2d(c['y'], c['z'], xedges, yedges)
+    return ev.n_events, ev.n_hits
+
+
+def run_sort1d_engine(state):
+    from dream.util.histogram import worker_sort1d
+    ev, chunks = state
+    edges = np.arange(0, 15000, 5)
+    for c in chunks:
+        worker_sort1d(c['t'], np.repeat(c['scan'], c['counts']), edges)
+    return ev.n_events, ev.n_hits
+
+
+def run_group_hist1d(state):
+    from dream.util.histogram import group_hist1d
+    ev, chunks = state
+    edges = np.arange(0, 15000, 5)
+    for c in chunks:
+        group_hist1d(c['t'], np.repeat(c['scan'], c['counts']), edges)
+    return ev.n_events, ev.n_hits
+
+
+#### gatherer (needs psmon for the plot classes)
+
+def setup_gather_kernel(ndim):
+    # worker payloads of every flush, in the legacy coo and the sparse (idx, count) encodings
+    def setup(ev):
+        from dream.util import histogram as hg
+        edges = np.arange(0, 15000, 1)
+        xedges, yedges = np.arange(-65, 65, 1), np.arange(-65, 65, 1)
+        coo, pairs = [], []
+        for c in ev.chunks():
+            if ndim == 1:
+                coo.append(hg.worker_sparse_hist1d_fast(c['t'], edges)[0])
+                pairs.append(hg.worker_hist1d(c['t'], edges, 'sparse'))
+            else:
+                coo.append(hg.worker_sparse_hist2d_fast(c['y'], c['z'], xedges, yedges)[0])
+                pairs.append(hg.worker_hist2d(c['y'], c['z'], xedges, yedges, 'sparse'))
+        shape = (edges.size - 1,) if ndim == 1 else (xedges.size - 1, yedges.size - 1)
+        return ev, np.zeros(shape, dtype=int), coo, pairs
+    return setup
+
+
+def run_gather_add_at(state):
+    ev, dense, coo, _ = state
+    for H in coo:
+        if dense.ndim == 1:
+            np.add.at(dense, H.row, H.data)
+        else:
+            np.add.at(dense, (H.row, H.col), H.data)
+    return ev.n_events, ev.n_hits
+
+
+def run_gather_scatter_add(state):
+    from dream.util.histogram import gather_dense_hist1d_fast, gather_dense_hist2d_fast
+    ev, dense, _, pairs = state
+    gather = gather_dense_hist1d_fast if dense.ndim == 1 else gather_dense_hist2d_fast
+    for H in pairs:
+        gather(dense, H)
+    return ev.n_events, ev.n_hits
+
+
+def setup_gather(plot_cls, worker_cls, p):
+    def setup(ev):
+        from dream.util import plots_callback, plots_comm
+        from dream.util.accumulator import columnar_accumulator
+        worker = getattr(plots_comm, worker_cls)('bench', p)
+        payloads = []
+        for c in ev.chunks():
+            acc = columnar_accumulator()
+            acc.append('hit_l:t', c['t']); acc.append('hit_l:y', c['y']); acc.append('hit_l:z', c['z'])
+            acc.append('hit_l:n', c['n']); acc.append('scan:var1', c['scan'])
+            out = {}
+            worker.accumulate(acc, out)
+            payloads.append(out)
+        return ev, getattr(plots_callback, plot_cls)('bench', p), payloads
+    return setup
+
+
+def run_gather(state):
+    ev, plot, payloads = state
+    plot._reset()
+    for out in payloads:
+        plot._accumulate(out)
+    return ev.n_events, ev.n_hits
+
+
+#### offline writer
+
+def setup_comm_offline(ev):
+    from dream.util.comm import comm_offline
+    from dream.util.record import event_record
+    requested = {'dld': {'hit_l': ['z', 'y', 't']}, 'x': {'timing': ['280', '281', 'dest'], 'bld': ['gmd'], 'scan': ['var1']}}
+    x_names = [name for name in ev.x[0] if name != 'timestamp']
+    record = event_record({'dld': requested['dld'], 'x': {k: [n.split(':')[1] for n in x_names if n.startswith(k+':')] for k in ['timing', 'bld', 'scan']}}, x_names)
+    config = {'xpand': True, 'data': {'ragged': {'hit_l': {'var': ['z', 'y', 't']}}}}
+    outputs = [{'x': x, 'hit_l': {k: h[k] for k in ['z', 'y', 't']}} for x, h in zip(ev.x, ev.hits)]
+    return ev, comm_offline(config), record, outputs
+
+
+class null_smd:
+    def event(self, evt, *args, **kwargs):
+        pass
+
+
+def run_comm_offline(state):
+    ev, comm, record, outputs = state
+    smd = null_smd()
+    for i, out in enumerate(outputs):
+        record.clear()
+        record.absorb(out)
+        comm.send(0, smd, i, None, record)
+    return ev.n_events, ev.n_hits
+
+
+def setup_writer(ev):
+    import tempfile
+    from dream.util.writer import columnar_writer
+    ev, comm, record, outputs = setup_comm_offline(ev)
+    from types import SimpleNamespace
+    path = os.path.join(tempfile.mkdtemp(), 'run0.h5')
+    evts = [SimpleNamespace(timestamp=i) for i in range(len(outputs))]
+    return ev, comm, record, outputs, evts, lambda: columnar_writer(path, batch_size=1000)
+
+
+def run_writer(state):
+    ev, comm, record, outputs, evts, make = state
+    smd = make()
+    for i, (out, evt) in enumerate(zip(outputs, evts)):
+        record.clear()
+        record.absorb(out)
+        comm.send(0, smd, i, evt, record)
+    smd.done()
+    return ev.n_events, ev.n_hits
+
+
+def all_cases():
+    hsd = {'arange': {'hit_l:t': [0, 15000, 1]}}
+    h2d = {'arange': {'hit_l:y': [-65, 65, 2], 'hit_l:z': [-65, 65, 2]}}
+    scan = {'var': 'hit_l:n', 'scan': 'scan:var1', 'decimals': 5}
+    return [
+        Case('cfd.find_peaks', setup_cfd, run_cfd),
+        Case('hsd_peak_finder.fex_batch', setup_peak_finder(True), run_peak_finder),
+        Case('hsd_peak_finder.fex_loop', setup_peak_finder(False), run_peak_finder),
+        Case('hitfinder.FindHits', setup_hit_finder, run_hit_finder),
+        Case('dld.numpy', setup_dld('dream.alg.dream.dld', sorter='numpy'), run_dld),
+        Case('dld.numpy.batch64', setup_dld('dream.alg.dream.dld', sorter='numpy'), run_dld_batch(64)),
+        Case('dld.asort', setup_dld('dream.alg.dream.dld', sorter='asort'), run_dld, requires=['dream.lib.libASort']),
+        Case('dld_shf', setup_dld('dream.alg.dream.dld_shf'), run_dld),
+        Case('worker.hist1d', setup_chunks, run_hist1d),
+        Case('worker.hist2d', setup_chunks, run_hist2d),
+        Case('worker.mean_sort', setup_chunks, run_mean_sort),
+        Case('worker.group_aggregate', setup_chunks, run_group_aggregate),
+        Case('worker.mean_sort2d', setup_chunks, run_mean_sort2d),
+        Case('worker.sort1d', setup_chunks, run_sort1d),
+        Case('worker.hist1d_engine', setup_chunks, run_hist1d_engine),
+        Case('worker.hist2d_engine', setup_chunks, run_hist2d_engine),
+        Case('worker.sort1d_engine', setup_chunks, run_sort1d_engine),
+        Case('worker.group_hist1d', setup_chunks, run_group_hist1d),
+        Case('gather.add_at.hist1d', setup_gather_kernel(1), run_gather_add_at, repeat=GATHER_REPEAT),
+        Case('gather.scatter_add.hist1d', setup_gather_kernel(1), run_gather_scatter_add, repeat=GATHER_REPEAT),
+        Case('gather.add_at.hist2d', setup_gather_kernel(2), run_gather_add_at, repeat=GATHER_REPEAT),
+        Case('gather.scatter_add.hist2d', setup_gather_kernel(2), run_gather_scatter_add, repeat=GATHER_REPEAT),
+        Case('gather.hist1d', setup_gather('Hist1DPlot', 'Hist1DWorkerPlot', hsd), run_gather, requires=['psmon']),
+        Case('gather.hist2d', setup_gather('Hist2DPlot', 'Hist2DWorkerPlot', h2d), run_gather, requires=['psmon']),
+        Case('gather.scan_var', setup_gather('ScanVarPlot', 'ScanVarWorkerPlot', scan), run_gather, requires=['psmon']),
+        Case('comm_offline.send', setup_comm_offline, run_comm_offline),
+        Case('writer.columnar', setup_writer, run_writer, requires=['h5py']),
+    ]
@@ -0,0 +1,105 @@
+import json
+import time
+import tracemalloc
+
+
+class Case:
+    """
+    One benchmark: `setup(events)` builds the inputs once, `run(state)` processes
+    them and returns (n_events, n_hits) so rates can be normalized. `repeat`
+    raises the number of timed runs for cases too short to time stably.
+    """
+    def __init__(self, name, setup, run, requires=None, repeat=None):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.requires = requires or []
+        self.repeat = repeat
+
+
+def measure(case, events, repeat=3):
+    state = case.setup(events)
+    case.run(state)  # warm-up (imports, first allocations)
+
+    best = float('inf')
+    for _ in range(max(repeat, case.repeat or 0)):
+        t0 = time.perf_counter()
+        n_events, n_hits = case.run(state)
+        best = min(best, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    case.run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'seconds': best,
+        'events': n_events,
+        'hits': n_hits,
+        'events_per_s': n_events/best if best > 0 else float('inf'),
+        'ns_per_hit': 1e9*best/n_hits if n_hits else None,
+        'peak_mem_kb': peak/1024,
+    }
+
+
+def missing_requirements(case):
+    import importlib
+    missing = []
+    for mod in case.requires:
+        try:
+            importlib.import_module(mod)
+        except ImportError:
+            missing.append(mod)
+    return missing
+
+
+def run_cases(cases, events, repeat=3, verbose=True):
+    results = {}
+    for case in cases:
+        missing = missing_requirements(case)
+        if missing:
+            if verbose: print(f"{case.name:<32} skipped (missing {', '.join(missing)})")
+            continue
+        results[case.name] = measure(case, events, repeat)
+        if verbose: print(format_row(case.name, results[case.name]))
+    return results
+
+
+def format_row(name, r, ref=None):
+    ns_hit = f"{r['ns_per_hit']:10.1f}" if r['ns_per_hit'] is not None else f"{'-':>10}"
+    row = f"{name:<32} {r['events_per_s']:12.1f} {ns_hit} {r['peak_mem_kb']:12.1f}"
+    if ref is not None:
+        row += f" {r['events_per_s']/ref['events_per_s']:8.2f}x"
+    return row
+
+
+def header(compare=False):
+    h = f"{'case':<32} {'events/s':>12} {'ns/hit':>10} {'peak kB':>12}"
+    return h + (f" {'vs base':>9}" if compare else '')
+
+
+def save(results, path, meta=None):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta or {}, 'results': results}, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Print results next to the baseline; returns the names of cases whose
+    throughput dropped by more than `tolerance` (relative).
+    """
+    print(header(compare=True))
+    regressions = []
+    for name, r in results.items():
+        ref = baseline.get(name)
+        print(format_row(name, r, ref))
+        if ref is not None and r['events_per_s'] < (1 - tolerance)*ref['events_per_s']:
+            regressions.append(name)
+    if regressions:
+        print('regressions:', ', '.join(regressions))
+    return regressions
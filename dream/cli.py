@@ -3,5 +3,9 @@ import runpy
 import sys
 
 def run():
+    # `dream merge ...` merges part files, anything else runs the analysis
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        from dream.util.merge import main
+        sys.exit(main(sys.argv[2:]))
     # this will execute dream/main.py as if you did `python -m dream.main`
     runpy.run_module("dream.main", run_name="__main__", alter_sys=True)
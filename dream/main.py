@@ -1,10 +1,10 @@
 import time
 import os, importlib
 from dream.util.setup import check_detectors, init
-from dream.util.misc import read_config, read_args, deep_merge
+from dream.util.misc import read_config, read_args, chunked
+from dream.util.record import event_record, fill_event, batch_outputs
 from dream.util.comm import comm_online, comm_offline
 from dream.alg.common.x import scan, bld, epics, timing
-from dream.util.callback import callback_online
 
 rank = int(os.getenv("OMPI_COMM_WORLD_RANK", 0))
 size = int(os.getenv("OMPI_COMM_WORLD_SIZE", 1))
@@ -40,6 +40,7 @@ for det in detectors:
     algs[det] = alg(**config_det[det]['kwargs'], requested_vars = requested_vars_by_detector[det], rank = rank) if 'kwargs' in config_det[det].keys() else alg(requested_vars = requested_vars_by_detector[det])
 
 if mode=='online':
+    from dream.util.callback import callback_online
     comm = comm_online(config, requested_vars_by_detector)
     callback = callback_online(rank, numworkers, config)
     callbacks=[callback.smalldata]
@@ -47,6 +48,9 @@ else:
     comm = comm_offline(config)
     callbacks = []
 
+record = event_record(requested_vars_by_detector, x_names=[name for alg in algs.values() for name in getattr(alg, 'x_names', [])])
+batch_events = max(int(config.get('batch_events') or 1), 1)
+
 while 1: 
     ds, smd = init(rank, mode, exp, run_num, config, callbacks=callbacks) 
 
@@ -79,21 +83,40 @@ while 1:
                     
 
         for det in detectors_rm: detectors.remove(det)
+        if mode == 'offline': comm.reset()
             
         priority = {'timing': 0, 'bld': 1}      
         detectors.sort(key=lambda x: priority.get(x, 2))
+
+        # x algorithms write straight into their record slots, the others are absorbed from their output
+        fillers = []
+        for det in detectors:
+            if hasattr(algs[det], 'fill'):
+                algs[det].bind(record, dets[det])
+                fillers.append((algs[det].fill, dets[det], True))
+            else:
+                fillers.append((algs[det], dets[det], False))
         
         n_evt = 0
         for step_i, step in enumerate(run.steps()):
+            if batch_events > 1:
+                # algorithms with a process_batch (dld) handle batch_events events per call
+                for events in chunked(step.events(), batch_events):
+                    batch = batch_outputs(fillers, events)
+                    for i, evt in enumerate(events):
+                        try:
+                            fill_event(record, fillers, evt, batch, i)
+                            comm.send(rank, smd, n_evt, evt, record)
+                            n_evt += 1
+                        except Exception as err:
+                           print(err)
+                continue
+
             for nevt,evt in enumerate(step.events()):
                 
                 try:
-                    evt_dict = {}     
-                    deep_merge(evt_dict, {'x':{'timestamp': evt.timestamp}})
-                    for det in detectors:
-                        deep_merge(evt_dict, algs[det](dets[det], evt, evt_dict['x']))
-                            
-                    comm.send(rank, smd, n_evt, evt, evt_dict)
+                    fill_event(record, fillers, evt)
+                    comm.send(rank, smd, n_evt, evt, record)
                     n_evt += 1
                 
                 except Exception as err:
@@ -0,0 +1,87 @@
+import numpy as np
+from typing import Iterable
+
+
+class columnar_accumulator:
+    """
+    Per-variable growable float64 buffers with a fill pointer and per-event offsets.
+
+    Values appended between two `clear()` calls are stored contiguously, so
+    `acc[key]` is a zero-copy view of everything accumulated so far. Buffers are
+    never shrunk; `clear()` only rewinds the fill pointers, so after the first
+    few flushes no allocation happens on the hot path.
+
+    Latest-value variables (waveforms, images, ...) are not accumulated; they are
+    stored by reference with `set()` and returned as-is.
+
+    Views handed out by `__getitem__` are only valid until the next `clear()`.
+    """
+
+    def __init__(self, keys: Iterable[str] = (), capacity: int = 1024):
+        self.capacity0 = max(int(capacity), 1)
+        self._buf = {}
+        self._fill = {}
+        self._offsets = {}
+        self._latest = {}
+        for k in keys:
+            self.add_key(k)
+
+    def add_key(self, key: str) -> None:
+        if key in self._buf:
+            return
+        self._buf[key] = np.empty(self.capacity0, dtype=float)
+        self._fill[key] = 0
+        self._offsets[key] = [0]
+
+    def append(self, key: str, values) -> None:
+        """Append one event worth of values (scalar or 1D array) to `key`."""
+        if key not in self._buf:
+            self.add_key(key)
+        vals = np.asarray(values, dtype=float).ravel()
+        n = vals.size
+        start = self._fill[key]
+        stop = start + n
+        buf = self._buf[key]
+        if stop > buf.size:
+            # amortized doubling; only the filled part is copied
+            new = np.empty(max(stop, 2 * buf.size), dtype=float)
+            new[:start] = buf[:start]
+            self._buf[key] = buf = new
+        buf[start:stop] = vals
+        self._fill[key] = stop
+        self._offsets[key].append(stop)
+
+    def set(self, key: str, value) -> None:
+        """Store the latest value of a non-accumulated variable."""
+        self._latest[key] = value
+
+    def offsets(self, key: str) -> np.ndarray:
+        """Per-event offsets into `self[key]` (length n_events + 1)."""
+        return np.asarray(self._offsets[key], dtype=int)
+
+    def n_events(self, key: str) -> int:
+        return len(self._offsets[key]) - 1
+
+    def clear(self) -> None:
+        """Rewind all fill pointers and drop latest values; keeps the buffers."""
+        for k in self._fill:
+            self._fill[k] = 0
+            self._offsets[k] = [0]
+        self._latest.clear()
+
+    def __getitem__(self, key: str):
+        if key in self._latest:
+            return self._latest[key]
+        return self._buf[key][:self._fill[key]]
+
+    def __contains__(self, key) -> bool:
+        return key in self._latest or key in self._buf
+
+    def keys(self):
+        return set(self._buf) | set(self._latest)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
@@ -1,3 +1,5 @@
+import time
+import threading
 from psmon import publish
 from collections import deque
 from dream.util.plots_callback import (
@@ -46,6 +48,76 @@ PLOT_CLASS_MAP = {
     'sigbkg1d':         SigBkg1DPlot,
 }
 
+class publish_cadence:
+    """
+    Publish timing: targets `interval` seconds between refreshes and stretches it
+    while rendering takes more than `max_load` of the time (threaded publishing
+    only). Each cycle selects the plots that changed since their last publish and
+    whose `priority` divides the cycle number (1 = every cycle).
+    """
+    def __init__(self, interval, max_load=0.5):
+        self.interval = interval
+        self.max_load = max_load
+        self.effective = interval
+        self.render_time = 0.
+        self.cycle = 0
+
+    def select(self, handlers):
+        self.cycle += 1
+        return [h for h in handlers if h._dirty and self.cycle % h.priority == 0]
+
+    def record(self, render_time):
+        self.render_time = 0.8*self.render_time + 0.2*render_time
+        self.effective = max(self.interval, self.render_time/self.max_load)
+
+
+class publish_thread:
+    """
+    Renders and sends plot snapshots on a background thread, at the rate set by
+    `cadence`. A new batch of snapshots is only accepted once the previous one
+    has been sent, so the plots' snapshot buffers are never in use twice.
+    """
+    def __init__(self, cadence):
+        self.cadence = cadence
+        self.last = 0.
+        self.busy = False
+        self.job = None
+        self.ready = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name='publish', daemon=True)
+        self.thread.start()
+
+    def due(self):
+        return not self.busy and time.monotonic() - self.last >= self.cadence.effective
+
+    def skip(self):
+        self.last = time.monotonic()
+
+    def submit(self, num, snaps):
+        with self.ready:
+            self.busy = True
+            self.last = time.monotonic()
+            self.job = (num, snaps)
+            self.ready.notify()
+
+    def run(self):
+        # psmon sockets are only touched from this thread
+        publish.init()
+        while True:
+            with self.ready:
+                while self.job is None:
+                    self.ready.wait()
+                num, snaps = self.job
+                self.job = None
+            t0 = time.monotonic()
+            for h, snap in snaps:
+                try:
+                    h._render(snap, num)
+                except Exception as err:
+                    print('publish', h.name, 'failed:', err)
+            self.cadence.record(time.monotonic() - t0)
+            self.busy = False
+
+
 class callback_online:
     def __init__(self, rank, numworkers, config):
         # derive all bin‐edges & scan‐axes
@@ -67,8 +139,17 @@ class callback_online:
             if PlotClass is None:
                 raise ValueError(f"Unknown plot type '{plot_type}' for plot '{name}'")
             handler = PlotClass(name, p)
+            handler.priority = max(int(p.get('priority', 1)), 1)
             self.handlers.append(handler)
 
+        # publish_interval > 0: publish changed plots on a background thread about every
+        # publish_interval seconds instead of every nacc2 updates on the ingest path.
+        # Every rank builds this object, so the thread (and its psmon ports) is only
+        # started by the first smalldata call, on the rank that runs the callback.
+        self.publish_interval = float(config.get('publish_interval') or 0)
+        self.cadence = None
+        self.publisher = None
+
 
 
     def smalldata(self, data_dict):
@@ -80,6 +161,7 @@ class callback_online:
                 self.numupdates = 0
                 for h in self.handlers:
                     h._reset()
+                    h._dirty = True
             return
 
         # accumulate new event
@@ -87,10 +169,27 @@ class callback_online:
         for h in self.handlers:
             h._accumulate(data_dict)
 
-        # publish every nacc2 events
+        if self.cadence is None:
+            self.cadence = publish_cadence(self.publish_interval)
+            if self.publish_interval > 0:
+                self.publisher = publish_thread(self.cadence)
+
+        if self.publisher is not None:
+            if self.publisher.due():
+                num = self.numupdates*self.nacc1
+                snaps = []
+                for h in self.cadence.select(self.handlers):
+                    snap = h._take_snapshot()
+                    if snap is not None: snaps.append((h, snap))
+                if snaps:
+                    self.publisher.submit(num, snaps)
+                else:
+                    self.publisher.skip()
+            return
+
+        # publish changed plots every nacc2 events
         if self.numupdates % self.nacc2 == 0:
             num = self.numupdates*self.nacc1
-            print('num:', num)
             publish.init()
-            for h in self.handlers:
+            for h in self.cadence.select(self.handlers):
                 h._publish(num)
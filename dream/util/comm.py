@@ -1,6 +1,7 @@
 import numpy as np
-from dream.util.histogram import worker_sparse_hist1d_fast, worker_sparse_hist2d_fast, group_sparse_hist1d_fast
-from dream.util.misc import head_match
+from dream.util.histogram import axis_cache
+from dream.util.accumulator import columnar_accumulator
+from dream.util.misc import missing_value
 from dream.util.plots_comm import MultiLineWorkerPlot, RollAvgWorkerPlot, ScanVarWorkerPlot, Scan2VarWorkerPlot, Hist1DWorkerPlot, Hist2DWorkerPlot , ScanHist1DWorkerPlot
 
 from dream.util.plots_comm import (SigBkg1DWorker, RollAvg1DFuncWorkerPlot, SingleLineFuncWorkerPlot, RollAvg1DWorkerPlot,
@@ -36,13 +37,13 @@ class comm_online:
         self.nacc1 = int(config['nacc'])
         self.handlers = []
 
-        # Build data accumulator
-        self.data_dict_acc = {
-            f"{k1}:{k2}": np.zeros(0, float)
+        # Build data accumulator (buffers are reused across flushes)
+        self.data_dict_acc = columnar_accumulator(
+            f"{k1}:{k2}"
             for detector in requested_vars_by_detector.values()
             for k1, sub in detector.items()
             for k2 in sub
-        }
+        )
 
         # Instantiate handlers based on config
         for name, p in config.get('plots', {}).items():
@@ -53,100 +54,178 @@ class comm_online:
             # Initialize the handler; each class is responsible for its own setup
             self.handlers.append(PlotClass(name, p))
 
+        # plots binning the same variable with the same edges share its bin indices
+        self.axes = axis_cache()
+        for h in self.handlers:
+            h.bind(self.axes)
+
     def histogram(self):
         self.data_dict = {}
         for h in self.handlers:
             h.accumulate(self.data_dict_acc, self.data_dict)
+        self.axes.clear()
 #        return self.data_dict
 
 
-    def send(self, rank, smd, nevt, evt, evt_dict):       
-    
-        for k1 in evt_dict.keys():
-            if head_match(k1.split('_')[0], ['wf', 'pdd', 'atm', 'fzp']):
-                continue
-            elif k1 == 'x':
-                for k2 in evt_dict[k1].keys():
-                    if k2 == 'timestamp': continue 
-                    self.data_dict_acc[k2] = np.append(self.data_dict_acc[k2], evt_dict[k1][k2])                
-            else:
-                for k2 in evt_dict[k1].keys():
-                    self.data_dict_acc[k1+':'+k2] = np.concatenate([self.data_dict_acc[k1+':'+k2], evt_dict[k1][k2]])
- 
-    
-        if nevt%self.nacc1==0:       
-                
-            for k1 in evt_dict.keys():
-                if head_match(k1.split('_')[0], ['wf', 'pdd', 'atm', 'fzp']):
-                    for k2 in evt_dict[k1].keys():
-                        self.data_dict_acc[k1+':'+k2] = evt_dict[k1][k2]
-                                                                                                      
-               
+    def send(self, rank, smd, nevt, evt, record):
+        # slot routing (accumulate / latest value) is precomputed by the event record
+        values = record.values
+        for i, name in record.acc_slots:
+            v = values[i]
+            if v is not None: self.data_dict_acc.append(name, v)
+
+        if nevt%self.nacc1==0:
+            for i, name in record.latest_slots:
+                v = values[i]
+                if v is not None: self.data_dict_acc.set(name, v)
+
             self.histogram()
             self.data_dict['rank'] = rank
             smd.event(evt, self.data_dict)
     
-            for k in self.data_dict_acc.keys():
-                self.data_dict_acc[k] = np.zeros(0, dtype=float)
+            self.data_dict_acc.clear()
+
+
+
+
 
+def xpand_view(value, shape):
+    # zero-stride view of a scalar (cheaper than np.broadcast_to, no copy like np.full)
+    value = np.asarray(value)
+    if value.ndim:
+        return np.broadcast_to(value, shape)
+    return np.ndarray(shape, value.dtype, value, 0, (0,)*len(shape))
 
 
+class column_format:
+    """
+    Output dtype and scale of one variable (offline.yaml `dtype`/`scale`).
+    Values are multiplied by `scale`; for integer types they are rounded and
+    clipped, and non-finite values become the missing value (-1 for signed,
+    the maximum for unsigned types).
+    """
+    def __init__(self, dtype=None, scale=None):
+        self.dtype = np.dtype(dtype) if dtype else None
+        self.scale = scale
+        self.fill = missing_value(self.dtype) if self.dtype is not None else np.nan
+        self.integer = self.dtype is not None and self.dtype.kind in 'iu'
+        if self.integer:
+            info = np.iinfo(self.dtype)
+            self.lo, self.hi = info.min, info.max
+
+    def __call__(self, values):
+        v = np.asarray(values)
+        if self.scale is not None:
+            v = v*self.scale
+        if self.integer and v.dtype.kind == 'f':
+            v = np.where(np.isfinite(v), np.clip(np.rint(v), self.lo, self.hi), self.fill)
+        return v if self.dtype is None else v.astype(self.dtype, copy=False)
+
+
+def option(item, key, var):
+    # a per-group setting, or a {var: setting} dict
+    value = item.get(key)
+    return value.get(var) if isinstance(value, dict) else value
+
+
+def var_format(item, var):
+    dtype, scale = option(item, 'dtype', var), option(item, 'scale', var)
+    if dtype is None and scale is None:
+        return None
+    return column_format(dtype, scale)
 
 
 class comm_offline:
+    """
+    Builds the per-event smalldata dict described by config['data'].
+
+    The config is compiled once into a writer plan; `send` only copies values.
+    Padded uniform variables are written into rows of a preallocated ring
+    (2*batch_size deep, since smalldata keeps references until its batch is
+    written) and xpand columns are zero-copy views of the x scalars.
+    Variables with a `dtype`/`scale` are cast once here, x variables through
+    data['x_format'] (keyed by 'prefix:var' or prefix).
+    Call `reset` after editing config['data'].
+    """
     def __init__(self,
                  config):
         
         self.config = config
+        self.nrows = 2*int(config.get('batch_size') or 1000)
+        self.reset()
+
+    def reset(self):
+        self.plan = None
+        self.row = 0
+        self.x_formats = {}
+
+    def compile(self):
+        data = self.config['data']
+        uniform = []
+        for k, c in (data.get('uniform') or {}).items():
+            padded = []
+            if 'var' in c:
+                for var in c['var']:
+                    fmt = var_format(c, var)
+                    dtype, fill = (float, np.nan) if fmt is None else (fmt.dtype or float, fmt.fill)
+                    padded.append((var, fmt, fill, np.full((self.nrows, c['len']), fill, dtype=dtype)))
+            uniform.append((k, [(var, var_format(c, var)) for var in c.get('fvar', [])], padded))
+        ragged = [(k, 'var_'+k, [(var, var_format(c, var)) for var in c['var']]) for k, c in (data.get('ragged') or {}).items()]
+        ragged_split = [(k, [(var, 'var_'+var, var_format(c, var)) for var in c['var']]) for k, c in (data.get('ragged_split') or {}).items()]
+        self.plan = (uniform, ragged, ragged_split, bool(self.config.get('xpand')), data.get('x_format') or {})
+
+    def x_format(self, name, formats):
+        fmt = self.x_formats.get(name, False)
+        if fmt is False:
+            spec = formats.get(name, formats.get(name.split(':')[0]))
+            fmt = self.x_formats[name] = None if not spec else column_format(spec.get('dtype'), spec.get('scale'))
+        return fmt
         
-    def send(self, rank, smd, nevt, evt, evt_dict):
+    def send(self, rank, smd, nevt, evt, record):
       
+        if self.plan is None: self.compile()
+        uniform, ragged, ragged_split, xpand, x_formats = self.plan
+        row = self.row
+        self.row = (row + 1) % self.nrows
+
+        x = record.x_dict()
+        if x_formats:
+            for xk, xv in x.items():
+                fmt = self.x_format(xk, x_formats)
+                if fmt is not None: x[xk] = fmt(xv)
         data_dict = {}
-        if 'uniform' in self.config['data'].keys():
-            for k in self.config['data']['uniform'].keys():
-                if 'uniform' not in data_dict.keys(): data_dict['uniform'] = {}
-                data_dict['uniform'][k] = {}                   
+        if uniform:
+            data_dict['uniform'] = out = {}
+            for k, fvars, padded in uniform:
+                group = record[k]
+                out[k] = d = {var: group[var] if fmt is None else fmt(group[var]) for var, fmt in fvars}
+                for var, fmt, fill, ring in padded:
+                    temp = ring[row]
+                    temp.fill(fill)
+                    v = group[var]
+                    n = min(len(v), len(temp))
+                    if n > 0: temp[:n] = v[:n] if fmt is None else fmt(v[:n])
+                    d[var] = temp
                 
-                if 'fvar' in self.config['data']['uniform'][k].keys():
-                    for var in self.config['data']['uniform'][k]['fvar']:                      
-                        data_dict['uniform'][k][var] = evt_dict[k][var]
-
-                if 'var' in self.config['data']['uniform'][k].keys():
-                    max_len = self.config['data']['uniform'][k]['len']
-                    for var in self.config['data']['uniform'][k]['var']:
-                        temp = np.full((max_len,), np.nan)
-                        var_len = len(evt_dict[k][var])
-                        if var_len>0:
-                            temp_len = min(var_len, max_len) 
-                            temp[:temp_len] = evt_dict[k][var][:temp_len]                           
-                        data_dict['uniform'][k][var] = temp
-                
-        if 'ragged' in self.config['data'].keys():
-            for k in self.config['data']['ragged'].keys():
-                if 'ragged' not in data_dict.keys(): data_dict['ragged'] = {}
-                data_dict['ragged']['var_'+k] = {}                
-                for var in self.config['data']['ragged'][k]['var']:
-                    data_dict['ragged']['var_'+k][var] = evt_dict[k][var]
-
-
-                if self.config['xpand'] and 'x' in evt_dict.keys():
-                    for xk in evt_dict['x'].keys():
-                        data_dict['ragged']['var_'+k][xk] = np.full(evt_dict[k][var].shape, evt_dict['x'][xk])
-
-        
-        if 'ragged_split' in self.config['data'].keys():
-            for k in self.config['data']['ragged_split'].keys():
-                if 'ragged_split' not in data_dict.keys(): data_dict['ragged_split'] = {}
-                data_dict['ragged_split'][k] = {}
-                for var in self.config['data']['ragged_split'][k]['var']:
-                    data_dict['ragged_split'][k]['var_'+var] = {var: evt_dict[k][var]}
-
-                    # if 'x' in evt_dict.keys():
-                    #     for xk in evt_dict['x'].keys():
-                    #         data_dict['ragged'][k]['var_'+var][xk] = np.full(evt_dict[k][var].shape, evt_dict['x'][xk], dtype=float)
+        if ragged:
+            data_dict['ragged'] = out = {}
+            for k, name, rvars in ragged:
+                group = record[k]
+                out[name] = d = {var: group[var] if fmt is None else fmt(group[var]) for var, fmt in rvars}
+                if xpand and x:
+                    # one hit per entry of the group's last variable
+                    shape = np.shape(d[rvars[-1][0]])
+                    for xk, xv in x.items():
+                        d[xk] = xpand_view(xv, shape)
+
+        if ragged_split:
+            data_dict['ragged_split'] = out = {}
+            for k, svars in ragged_split:
+                group = record[k]
+                out[k] = {name: {var: group[var] if fmt is None else fmt(group[var])} for var, name, fmt in svars}
               
-        if 'x' in evt_dict.keys():
-            data_dict['x'] = evt_dict['x']
+        if x:
+            data_dict['x'] = x
 
         smd.event(evt, data_dict)
 
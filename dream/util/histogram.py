@@ -211,34 +211,24 @@ def group_sparse_hist1d_fast(
         Maps each unique rounded data2 value to its sparse histogram of data1.
     num_dict : Dict[float, float]
         Maps each unique rounded data2 value to either the count or weighted sum.
-    """
-    if data1.shape != data2.shape:
-        raise ValueError("data1 and data2 must have the same shape.")
-    if arr_norm is not None and arr_norm.shape != data1.shape:
-        raise ValueError("arr_norm must be the same shape as data1/data2.")
-
-    # Round data2
-    data2_rounded = np.round(data2, decimals)
 
-    # Find unique rounded values
-    unique_vals = np.unique(data2_rounded)
+    This is a compatibility view over `group_hist1d`, which does the grouping
+    and binning in one pass; new code should use that directly.
+    """
+    H, keys, num = group_hist1d(data1, data2, edges, decimals, arr_norm, encoding='sparse')
+    rows, cols, counts = H
+    N = edges.size - 1
+    bounds = np.searchsorted(rows, np.arange(keys.size + 1))
 
-    # Prepare output dicts
     H_sp_dict: Dict[float, sparse.coo_matrix] = {}
     num_dict: Dict[float, float] = {}
-
-    for val in unique_vals:
-        inds = np.nonzero(data2_rounded == val)[0]
-        if arr_norm is None:
-            # simple count
-            num_dict[val] = float(inds.size)
-        else:
-            # weighted sum
-            num_dict[val] = float(arr_norm[inds].sum())
-
-        # build sparse histogram for this slice of data1
-        H_sp, _ = worker_sparse_hist1d_fast(data1[inds], edges)
-        H_sp_dict[val] = H_sp
+    for g, val in enumerate(keys):
+        lo, hi = bounds[g], bounds[g + 1]
+        H_sp_dict[val] = sparse.coo_matrix(
+            (counts[lo:hi], (cols[lo:hi], np.zeros(hi - lo, dtype=int))),
+            shape=(N, 1)
+        )
+        num_dict[val] = float(num[g])
 
     return H_sp_dict, num_dict
 
@@ -290,20 +280,245 @@ def worker_sparse_hist2d_fast(
     return H_sp, xedges, yedges
 
 # -------------------------------------------------------------------
-# STEP 4: gathering into dense arrays (no change!)
+# Histogram engine: dense bincount or compact sparse (index, count) pairs
 # -------------------------------------------------------------------
 
-def gather_dense_hist1d_fast(
-    dense_hist: np.ndarray,
-    sparse_hist: sparse.coo_matrix
-) -> None:
-    np.add.at(dense_hist, sparse_hist.row, sparse_hist.data)
+DENSE_MAX_BINS = 4096   # 'auto' always goes dense up to this many bins
+DENSE_MIN_FILL = 0.25   # ... and above it when samples >= this fraction of the bins
+
+
+def choose_encoding(nbins: int, nsamples: int, encoding: str = 'auto') -> str:
+    """
+    'dense' (fixed-size bincount) or 'sparse' (index/count pairs).
+    With 'auto', sparse is only used for wide histograms that the samples
+    can fill only thinly.
+    """
+    if encoding != 'auto':
+        return encoding
+    if nbins <= DENSE_MAX_BINS or nsamples >= DENSE_MIN_FILL * nbins:
+        return 'dense'
+    return 'sparse'
+
+
+def bin_index(data: np.ndarray, edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Arithmetic bin index of uniform `edges` and the in-range mask."""
+    n = edges.size - 1
+    idx = ((data - edges[0]) / (edges[1] - edges[0])).astype(int)
+    mask = (idx >= 0) & (idx < n)
+    return idx, mask
+
+
+def encode_counts(flat: np.ndarray, nbins: int, encoding: str = 'auto'):
+    """
+    Count in-range bin indices `flat`. Returns a dense int array of length
+    `nbins`, or an (index, count) pair of int arrays with unique indices.
+    Counts keep the default int dtype of the gatherer's dense histograms, so
+    they add into them without a cast.
+    """
+    if choose_encoding(nbins, flat.size, encoding) == 'dense':
+        return np.bincount(flat, minlength=nbins)
+    return np.unique(flat, return_counts=True)
+
+
+class axis_cache:
+    """
+    Bin indices of accumulated variables, computed once per flush and shared by
+    every histogram that bins the same variable with the same edges. Axes
+    registered by a single plot are not kept. `clear()` must be called when
+    the accumulator is cleared.
+    """
+    def __init__(self):
+        self.users = {}    # key -> number of plots binning that axis
+        self._index = {}
+
+    @staticmethod
+    def key(var: str, edges: np.ndarray) -> tuple:
+        return (var, float(edges[0]), float(edges[1] - edges[0]), edges.size)
+
+    def register(self, var: str, edges: np.ndarray) -> tuple:
+        k = self.key(var, edges)
+        self.users[k] = self.users.get(k, 0) + 1
+        return k
+
+    def index(self, data_acc, k: tuple) -> Tuple[np.ndarray, np.ndarray]:
+        hit = self._index.get(k)
+        if hit is None:
+            var, start, step, size = k
+            idx = ((np.atleast_1d(data_acc[var]) - start) / step).astype(int)
+            hit = (idx, (idx >= 0) & (idx < size - 1))
+            if self.users.get(k, 0) > 1:
+                self._index[k] = hit
+        return hit
+
+    def clear(self) -> None:
+        self._index.clear()
+
+
+def hist1d_from_index(idx: np.ndarray, mask: np.ndarray, nbins: int, encoding: str = 'auto'):
+    return encode_counts(idx[mask], nbins, encoding)
+
+
+def hist2d_from_index(ix: np.ndarray, mx: np.ndarray, iy: np.ndarray, my: np.ndarray,
+                      nx: int, ny: int, encoding: str = 'auto'):
+    mask = mx & my
+    H = encode_counts(ix[mask] * ny + iy[mask], nx * ny, encoding)
+    return H.reshape(nx, ny) if isinstance(H, np.ndarray) else H
+
+
+def worker_hist1d(data: np.ndarray, edges: np.ndarray, encoding: str = 'auto'):
+    """1D histogram of `data`: dense (N,) or sparse (idx, count)."""
+    return hist1d_from_index(*bin_index(data, edges), edges.size - 1, encoding)
+
+
+def worker_hist2d(x: np.ndarray, y: np.ndarray, xedges: np.ndarray, yedges: np.ndarray,
+                  encoding: str = 'auto'):
+    """2D histogram: dense (nx, ny) or sparse (flat idx, count) in C order."""
+    return hist2d_from_index(*bin_index(x, xedges), *bin_index(y, yedges),
+                             xedges.size - 1, yedges.size - 1, encoding)
+
+
+def worker_sort1d(
+    data: np.ndarray,
+    scan: np.ndarray,
+    data_edges: np.ndarray,
+    decimals: int = 5,
+    arr_norm: Optional[np.ndarray] = None,
+    encoding: str = 'auto'
+):
+    """
+    Same grouping as worker_sparse_sort1d_fast. H is a dense (G, M) array or a
+    sparse (row, col, count) triple of int arrays.
+    Returns H, sorted_keys (G,), num_arr (G,).
+    """
+    if data.shape != scan.shape:
+        raise ValueError("`data` and `scan` must have the same shape")
+    if arr_norm is not None and arr_norm.shape != data.shape:
+        raise ValueError("`arr_norm` must match input shapes")
+    bins, mask = bin_index(data, data_edges)
+    return sort1d_from_index(bins, mask, scan, data_edges.size - 1, decimals, arr_norm, encoding)
+
+
+def sort1d_from_index(
+    bins: np.ndarray,
+    mask: np.ndarray,
+    scan: np.ndarray,
+    M: int,
+    decimals: int = 5,
+    arr_norm: Optional[np.ndarray] = None,
+    encoding: str = 'auto'
+):
+    sorted_keys, inv = np.unique(np.round(scan, decimals), return_inverse=True)
+    G = sorted_keys.size
+    inv_m = inv[mask]
+    H = block_from_index(inv, G, bins, mask, M, encoding)
+
+    if arr_norm is None:
+        num_arr = np.bincount(inv_m, minlength=G)
+    else:
+        num_arr = np.bincount(inv_m, weights=arr_norm[mask].astype(float), minlength=G)
+
+    return H, sorted_keys, num_arr
+
+
+def block_from_index(inv: np.ndarray, G: int, bins: np.ndarray, mask: np.ndarray, M: int,
+                     encoding: str = 'auto'):
+    """(G, M) counts of group `inv` x bin `bins`: dense array or (row, col, count) triple."""
+    H = encode_counts(inv[mask] * M + bins[mask], G * M, encoding)
+    if isinstance(H, np.ndarray):
+        return H.reshape(G, M)
+    idx, counts = H
+    return idx // M, idx % M, counts
+
+
+def group_hist1d(
+    data1: np.ndarray,
+    data2: np.ndarray,
+    edges: np.ndarray,
+    decimals: int = 5,
+    arr_norm: Optional[np.ndarray] = None,
+    encoding: str = 'auto'
+):
+    """
+    Histogram `data1` per rounded value of `data2` with one unique + bincount pass.
+    Returns H (G, M) as in worker_sort1d, the sorted keys (G,), and per key the
+    sample count or `arr_norm` sum over all its samples, in range or not (G,).
+    """
+    if data1.shape != data2.shape:
+        raise ValueError("data1 and data2 must have the same shape.")
+    if arr_norm is not None and arr_norm.shape != data1.shape:
+        raise ValueError("arr_norm must be the same shape as data1/data2.")
+
+    keys, inv = np.unique(np.round(data2, decimals), return_inverse=True)
+    G = keys.size
+    bins, mask = bin_index(data1, edges)
+    H = block_from_index(inv, G, bins, mask, edges.size - 1, encoding)
+    weights = None if arr_norm is None else arr_norm.astype(float)
+    num = np.bincount(inv, weights=weights, minlength=G).astype(float)
+    return H, keys, num
+
+
+def hist_entries(H, ncols: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(rows, cols, values) of a 2D histogram in any of the worker encodings."""
+    if sparse.issparse(H):
+        return H.row, H.col, H.data
+    if isinstance(H, tuple):
+        if len(H) == 3:
+            return H
+        idx, counts = H
+        return idx // ncols, idx % ncols, counts
+    rows, cols = np.nonzero(H)
+    return rows, cols, H[rows, cols]
 
-def gather_dense_hist2d_fast(
-    dense_hist: np.ndarray,
-    sparse_hist: sparse.coo_matrix
-) -> None:
-    np.add.at(dense_hist, (sparse_hist.row, sparse_hist.col), sparse_hist.data)
+
+# -------------------------------------------------------------------
+# STEP 4: gathering into dense arrays
+# -------------------------------------------------------------------
+
+def scatter_add(dense: np.ndarray, idx, values) -> None:
+    """
+    dense[idx] += values. `idx` is a flat index or a tuple of per-axis indices;
+    tuples are raveled first since np.add.at is much faster on a flat index.
+    `values` should have the dtype of `dense` (the worker counts do), otherwise
+    np.add.at falls back to a casting loop.
+    """
+    if isinstance(idx, tuple):
+        idx = np.ravel_multi_index(idx, dense.shape)
+    if dense.ndim == 1:
+        np.add.at(dense, idx, values)
+    elif dense.flags.c_contiguous:
+        np.add.at(dense.reshape(-1), idx, values)
+    else:
+        np.add.at(dense, np.unravel_index(idx, dense.shape), values)
+
+
+def gather_dense_hist1d_fast(dense_hist: np.ndarray, hist) -> None:
+    """Add a worker histogram (dense array, (idx, count) pair or coo_matrix) into `dense_hist`."""
+    if isinstance(hist, np.ndarray):
+        dense_hist += hist
+    elif isinstance(hist, tuple):
+        scatter_add(dense_hist, *hist)
+    else:
+        scatter_add(dense_hist, hist.row, hist.data)
+
+def gather_dense_hist2d_fast(dense_hist: np.ndarray, hist) -> None:
+    """Add a worker 2D histogram (dense array, (flat idx, count) pair or coo_matrix) into `dense_hist`."""
+    if isinstance(hist, np.ndarray):
+        dense_hist += hist
+    elif isinstance(hist, tuple):
+        scatter_add(dense_hist, *hist)
+    else:
+        scatter_add(dense_hist, (hist.row, hist.col), hist.data)
+
+def gather_dense_sort1d(dense_hist: np.ndarray, hist, rows: np.ndarray) -> None:
+    """
+    Add a worker_sort1d histogram (G_local, M) into `dense_hist`; `rows` maps
+    each local group to its row in `dense_hist`.
+    """
+    if isinstance(hist, np.ndarray):
+        dense_hist[rows] += hist
+    else:
+        r, c, v = hist_entries(hist, dense_hist.shape[1])
+        scatter_add(dense_hist, (rows[r], c), v)
 
 # -------------------------------------------------------------------
 # EXAMPLE USAGE
@@ -329,3 +544,201 @@ def gather_dense_hist2d_fast(
 # # 4) As sparse pieces arrive:
 # gather_dense_hist1d_fast(dense_nl, H1_sp)
 # gather_dense_hist2d_fast(dense_xy, Hxy_sp)
+
+
+class scan_key_axis:
+    """
+    Growable scan-key axis for the gatherer accumulators.
+
+    Keys get append-only slots found through a dict, so existing rows never
+    move; arrays attached to the axis are grown with `fit` by capacity
+    doubling. The sorted order is only computed when publishing (`order`).
+    """
+    def __init__(self, capacity: int = 16):
+        self.capacity = max(int(capacity), 1)
+        self.keys = np.empty(self.capacity, dtype=float)
+        self.index = {}
+        self.size = 0
+        self._order = None
+
+    def reset(self) -> None:
+        # capacity is kept; callers zero their arrays
+        self.index.clear()
+        self.size = 0
+        self._order = None
+
+    def slots(self, keys) -> np.ndarray:
+        """Slots of `keys`, inserting all new ones in one batch."""
+        keys = np.atleast_1d(keys).tolist()
+        index = self.index
+        new = [v for v in dict.fromkeys(keys) if v not in index]
+        if new:
+            start, stop = self.size, self.size + len(new)
+            if stop > self.capacity:
+                self.capacity = max(stop, 2 * self.capacity)
+                grown = np.empty(self.capacity, dtype=float)
+                grown[:start] = self.keys[:start]
+                self.keys = grown
+            self.keys[start:stop] = new
+            index.update(zip(new, range(start, stop)))
+            self.size = stop
+            self._order = None
+        return np.fromiter((index[v] for v in keys), dtype=int, count=len(keys))
+
+    def fit(self, arr: np.ndarray, axis: int = 0) -> np.ndarray:
+        """`arr` grown with zeros along `axis` to the current capacity."""
+        n = arr.shape[axis]
+        if n >= self.capacity:
+            return arr
+        shape = list(arr.shape)
+        shape[axis] = self.capacity
+        grown = np.zeros(shape, dtype=arr.dtype)
+        grown[(slice(None),) * axis + (slice(0, n),)] = arr
+        return grown
+
+    def order(self) -> np.ndarray:
+        """Slots in ascending key order."""
+        if self._order is None:
+            self._order = np.argsort(self.keys[:self.size], kind='stable')
+        return self._order
+
+    def sorted_keys(self) -> np.ndarray:
+        return self.keys[:self.size][self.order()]
+
+
+
+# Mergeable scalar aggregates: a float64 record (sum, count, sumsq) that workers
+# send instead of a per-rank mean, so the gatherer can combine ranks with
+# different event counts exactly by adding records.
+AGG_SUM, AGG_COUNT, AGG_SUMSQ = range(3)
+AGG_SIZE = 3
+
+
+def worker_aggregate(arr: np.ndarray) -> np.ndarray:
+    arr = np.asarray(arr, dtype=float).ravel()
+    return np.array([arr.sum(), arr.size, np.dot(arr, arr)])
+
+
+def worker_group_aggregate(
+    data: np.ndarray,
+    scan: np.ndarray,
+    decimals: int = 5,
+    arr_norm: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Aggregate records of `data` per rounded `scan` value: sorted keys (G,) and a
+    (G, AGG_SIZE) stack. With `arr_norm` the count is the sum of the norm.
+    """
+    if data.shape != scan.shape:
+        raise ValueError("`data` and `scan` must have the same shape")
+    if arr_norm is not None and arr_norm.shape != data.shape:
+        raise ValueError("`arr_norm` must match input shapes")
+    data = np.asarray(data, dtype=float)
+    sorted_keys, inv = np.unique(np.round(scan, decimals), return_inverse=True)
+    G = sorted_keys.size
+    agg = np.empty((G, AGG_SIZE))
+    agg[:, AGG_SUM] = np.bincount(inv, weights=data, minlength=G)
+    agg[:, AGG_COUNT] = np.bincount(inv, weights=None if arr_norm is None else arr_norm.astype(float), minlength=G)
+    agg[:, AGG_SUMSQ] = np.bincount(inv, weights=data * data, minlength=G)
+    return sorted_keys, agg
+
+
+def as_aggregate(value) -> np.ndarray:
+    """Aggregate record of `value`; a plain scalar (older workers) counts as one sample."""
+    value = np.asarray(value, dtype=float)
+    if value.shape == (AGG_SIZE,):
+        return value
+    return worker_aggregate(value)
+
+
+def aggregate_stats(agg: np.ndarray) -> Tuple[float, float]:
+    """(mean, population std) of an aggregate record, or column-wise of a stack of them."""
+    agg = np.asarray(agg, dtype=float)
+    count = agg[..., AGG_COUNT]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = agg[..., AGG_SUM] / count
+        var = agg[..., AGG_SUMSQ] / count - mean * mean
+    return mean, np.sqrt(np.maximum(var, 0.0))
+
+
+class rolling_sum:
+    """
+    Sum over the last `window` appended rows, kept in a preallocated ring.
+
+    Each append adds the new row and subtracts the evicted one, so the mean is
+    O(row) instead of a re-stack of the whole window. The sum is recomputed
+    from the ring every `resync` appends (default `window`) to bound drift.
+    With `squares` the sum of squares is kept as well, for `std`.
+    """
+    def __init__(self, window: int, resync: Optional[int] = None, squares: bool = False):
+        self.window = max(int(window), 1)
+        self.resync = int(resync or self.window)
+        self.squares = squares
+        self.ring = None
+        self.sum = None
+        self.sumsq = None
+        self.pos = 0
+        self.count = 0
+        self._appends = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clear(self) -> None:
+        # buffers are kept for the next run
+        self.pos = 0
+        self.count = 0
+        self._appends = 0
+        if self.sum is not None:
+            self.sum.fill(0.0)
+        if self.sumsq is not None:
+            self.sumsq.fill(0.0)
+
+    def append(self, row) -> None:
+        row = np.asarray(row, dtype=float)
+        if self.ring is None or self.ring.shape[1:] != row.shape:
+            self.ring = np.empty((self.window,) + row.shape, dtype=float)
+            self.sum = np.zeros(row.shape, dtype=float)
+            self.sumsq = np.zeros(row.shape, dtype=float) if self.squares else None
+            self.pos = self.count = self._appends = 0
+        if self.count == self.window:
+            old = self.ring[self.pos]
+            self.sum -= old
+            if self.squares: self.sumsq -= old * old
+        else:
+            self.count += 1
+        self.ring[self.pos] = row
+        self.sum += row
+        if self.squares: self.sumsq += row * row
+        self.pos = (self.pos + 1) % self.window
+        self._appends += 1
+        if self._appends % self.resync == 0:
+            live = self.ring[:self.count]
+            np.sum(live, axis=0, out=self.sum)
+            if self.squares: np.sum(live * live, axis=0, out=self.sumsq)
+
+    def mean(self, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        if not self.count:
+            return None
+        return np.divide(self.sum, self.count, out=out)
+
+    def std(self) -> Optional[np.ndarray]:
+        """Population standard deviation over the window (needs `squares`)."""
+        if not self.count:
+            return None
+        mean = self.sum / self.count
+        return np.sqrt(np.maximum(self.sumsq / self.count - mean * mean, 0.0))
+
+    def rows(self, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Rows in the window, oldest first."""
+        if not self.count:
+            return None
+        if self.count < self.window:
+            head, tail = self.ring[:self.count], self.ring[:0]
+        else:
+            head, tail = self.ring[self.pos:], self.ring[:self.pos]
+        if out is None:
+            out = np.empty((self.count,) + self.ring.shape[1:], dtype=float)
+        out[:len(head)] = head
+        out[len(head):] = tail
+        return out
@@ -0,0 +1,141 @@
+import os
+import glob
+import re
+import numpy as np
+from dream.util.misc import missing_value
+
+
+def mpi_comm():
+    try:
+        from mpi4py import MPI
+    except ImportError as err:
+        print('mpi4py unavailable, part files are not merged:', err)
+        return None
+    return MPI.COMM_WORLD
+
+
+def is_ragged(name: str) -> bool:
+    # members of a var_* group hold hits, everything else one row per event
+    parts = name.split('/')
+    return len(parts) > 1 and parts[-2].startswith('var_')
+
+
+def part_files(h5_path: str):
+    """Per-rank part files of `h5_path`, in rank order."""
+    parts = glob.glob(h5_path[:-3] + '_part*.h5')
+    rank = lambda p: int(re.search(r'_part(\d+)\.h5$', p).group(1))
+    return sorted((p for p in parts if re.search(r'_part(\d+)\.h5$', p)), key=rank)
+
+
+def merge_parts(h5_path: str, parts=None, index: bool = False) -> None:
+    """
+    Stitch per-rank part files into `h5_path` with HDF5 virtual datasets, so no
+    data is copied. Per-event datasets are laid out part after part (rows a part
+    did not write read as the missing value); ragged members are concatenated.
+
+    With `index`, 'index/order' holds the event rows in timestamp order and
+    'index/<group>_start' the first hit of every event of each ragged group.
+    """
+    import h5py
+    parts = part_files(h5_path) if parts is None else list(parts)
+    out_dir = os.path.dirname(os.path.abspath(h5_path))
+
+    # name -> (dtype, trailing shape), part -> {name: length}, part -> events
+    schema = {}
+    lengths = []
+    events = []
+    for part in parts:
+        with h5py.File(part, 'r') as f:
+            found = {}
+            def visit(name, obj):
+                if isinstance(obj, h5py.Dataset):
+                    found[name] = obj.shape[0]
+                    schema.setdefault(name, (obj.dtype, obj.shape[1:]))
+            f.visititems(visit)
+            lengths.append(found)
+            events.append(found.get('timestamp', 0))
+
+    with h5py.File(h5_path, 'w') as out:
+        for name, (dtype, tail) in sorted(schema.items()):
+            ragged = is_ragged(name)
+            sizes = [found.get(name, 0) if ragged else n for found, n in zip(lengths, events)]
+            layout = h5py.VirtualLayout(shape=(sum(sizes),) + tail, dtype=dtype)
+            start = 0
+            for part, found, size in zip(parts, lengths, sizes):
+                n = found.get(name)
+                if n:
+                    # relative source paths keep the merged file valid when the directory moves
+                    src = os.path.relpath(os.path.abspath(part), out_dir)
+                    layout[start:start + n] = h5py.VirtualSource(src, name, shape=(n,) + tail)
+                start += size
+            fill = 0 if name.endswith('_len') else missing_value(dtype)
+            out.create_virtual_dataset(name, layout, fillvalue=fill)
+
+        if index and 'timestamp' in out:
+            out['index/order'] = np.argsort(out['timestamp'][()], kind='stable')
+            for name in schema:
+                if name.endswith('_len'):
+                    counts = out[name][()]
+                    start = np.zeros(len(counts), dtype=np.int64)
+                    np.cumsum(counts[:-1], out=start[1:])
+                    out[f'index/{name[:-4]}_start'] = start
+
+
+class merge_at_done:
+    """
+    Wraps a smalldata-like writer so that `done` also merges the part files:
+    all ranks meet at a barrier after their own `done`, then rank 0 merges.
+    """
+    def __init__(self, smd, h5_path: str, rank: int, index: bool = False):
+        self.smd = smd
+        self.h5_path = h5_path
+        self.rank = rank
+        self.index = index
+
+    def __getattr__(self, name):
+        return getattr(self.smd, name)
+
+    def event(self, *args, **kwargs):
+        self.smd.event(*args, **kwargs)
+
+    def done(self):
+        self.smd.done()
+        comm = mpi_comm()
+        if comm is None:
+            return
+        comm.Barrier()
+        if self.rank == 0:
+            parts = part_files(self.h5_path)
+            if parts:
+                merge_parts(self.h5_path, parts, self.index)
+
+
+def main(argv=None) -> int:
+    """`dream merge`: merge the part files of a run (or of the given files)."""
+    import argparse
+    parser = argparse.ArgumentParser(prog='dream merge', description='merge per-rank part files into virtual datasets')
+    parser.add_argument('files', metavar='FILE', nargs='*', help='merged file(s) to write, e.g. run42.h5')
+    parser.add_argument('--exp', metavar='NAME', type=str, default=None, help='experiment, with --run (path from offline.yaml)')
+    parser.add_argument('--run', metavar='N', type=int, default=None, help='run number, with --exp')
+    parser.add_argument('--index', action='store_true', help='also write the timestamp-sorted index')
+    args = parser.parse_args(argv)
+
+    files = list(args.files)
+    if args.run is not None:
+        from dream.util.misc import read_config
+        from dream.util.setup import h5_file
+        config_dir = os.getenv("CONFIGDIR")
+        instrument = read_config(config_dir+'instrument.yaml')['instrument']
+        config = read_config(config_dir+instrument+'/offline.yaml')
+        files.append(h5_file(config, args.exp, args.run))
+    if not files:
+        parser.error('give FILE or --exp/--run')
+
+    for h5_path in files:
+        parts = part_files(h5_path)
+        if not parts:
+            print(f"no part files for {h5_path}")
+            return 1
+        merge_parts(h5_path, parts, args.index)
+        print(f"merged {len(parts)} parts into {h5_path}")
+    return 0
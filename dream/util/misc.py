@@ -1,5 +1,7 @@
 from typing import Optional, List, Any
+from itertools import islice
 import importlib
+import numpy as np
 
 def deep_merge(orig, new):
     """
@@ -24,6 +26,26 @@ def head_match(a: str, b: List[str]) -> bool:
             return True
     return False
 
+def chunked(iterable, n: int):
+    """Yield lists of up to `n` consecutive items of `iterable`."""
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, n))
+        if not chunk:
+            return
+        yield chunk
+
+def missing_value(dtype):
+    """Fill for rows an event did not write: NaN for floats, -1 / max for signed / unsigned ints."""
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'fc':
+        return np.nan
+    if dtype.kind == 'i':
+        return -1
+    if dtype.kind == 'u':
+        return np.iinfo(dtype).max
+    return 0
+
 def lists_intersection(a: List[Any], b: List[Any]) -> List[Any]:
     """
     Return a list of the unique elements that appear in both a and b,
@@ -78,11 +100,22 @@ def read_args():
         help='(optional) run number; if provided, we switch to offline mode'
     )
 
+    parser.add_argument(
+        '--synthetic',
+        action='store_true',
+        help='(optional) use the synthetic data source instead of psana (same as DREAM_SYNTHETIC=1)'
+    )
+
     args = parser.parse_args()
 
     exp     = args.exp
     run_num = args.run
 
+    if args.synthetic:
+        import os
+        os.environ['DREAM_SYNTHETIC'] = '1'
+        if exp is None: exp = 'synthetic'
+
     #print(f"exp: {exp!r}, runnum: {run_num!r}")
 
     mode = 'online' if run_num is None else 'offline'
@@ -1,13 +1,16 @@
-from bisect import bisect_left
 import numpy as np
-from collections import deque
 from psmon import publish
 from psmon.plots import XYPlot, Image
-from dream.util.histogram import gather_dense_hist1d_fast
+from dream.util.histogram import gather_dense_hist1d_fast, gather_dense_sort1d, scan_key_axis, rolling_sum
+from dream.util.histogram import AGG_SIZE, as_aggregate, aggregate_stats
 
 class BasePlot:
+    priority = 1   # published every `priority`-th cadence cycle
+
     def __init__(self, name):
         self.name = name
+        self._buffers = {}
+        self._dirty = True   # changed since the last snapshot
 
     def _reset(self):
         raise NotImplementedError
@@ -15,9 +18,32 @@ class BasePlot:
     def _accumulate(self, data_dict):
         raise NotImplementedError
 
-    def _publish(self, num_events):
+    def _snapshot(self):
+        """Cheap copy of the state `_render` needs, taken between two accumulates; None skips the plot."""
         raise NotImplementedError
 
+    def _take_snapshot(self):
+        self._dirty = False
+        return self._snapshot()
+
+    def _render(self, snap, num_events):
+        """Expensive transforms and publish.send; may run on the publish thread."""
+        raise NotImplementedError
+
+    def _publish(self, num_events):
+        snap = self._take_snapshot()
+        if snap is not None:
+            self._render(snap, num_events)
+
+    def _back(self, key, arr):
+        # double buffer: a snapshot is only taken once the previous one has been sent,
+        # so the back buffer can be reused as long as the shape does not change
+        buf = self._buffers.get(key)
+        if buf is None or buf.shape != arr.shape or buf.dtype != arr.dtype:
+            buf = self._buffers[key] = np.empty_like(arr)
+        np.copyto(buf, arr)
+        return buf
+
 
 class MultiLinePlot(BasePlot):
     def __init__(self, name, p):
@@ -38,17 +64,23 @@ class MultiLinePlot(BasePlot):
                 arr = np.asarray(data_dict[var])
                 x_arrays.append(np.arange(arr.size))
                 y_arrays.append(arr)
+        if y_arrays: self._dirty = True
         self._last_x, self._last_y = x_arrays, y_arrays
 
-    def _publish(self, num_events):
+    def _snapshot(self):
+        # arrays are replaced, not modified, by _accumulate
         if not self._last_y:
-            return
+            return None
+        return list(self._last_x), list(self._last_y)
+
+    def _render(self, snap, num_events):
+        x, y = snap
         plot = XYPlot(
             num_events,
             self.name,
-            self._last_x,
-            self._last_y,
-            formats=['-'] * len(self._last_y)
+            x,
+            y,
+            formats=['-'] * len(y)
         )
         publish.send(self.name, plot)
 
@@ -72,13 +104,17 @@ class Hist1DPlot(BasePlot):
         key = self.name
         if key in data_dict:
             gather_dense_hist1d_fast(self.dense, data_dict[key])
+            self._dirty = True
 
-    def _publish(self, num_events):
+    def _snapshot(self):
+        return self._back('dense', self.dense)
+
+    def _render(self, snap, num_events):
         plot = XYPlot(
             num_events,
             self.name,
             self.centers,
-            self.dense,
+            snap,
             formats=['-']
         )
         publish.send(self.name, plot)
@@ -104,12 +140,16 @@ class Hist2DPlot(BasePlot):
         if key in data_dict:
             from dream.util.histogram import gather_dense_hist2d_fast
             gather_dense_hist2d_fast(self.dense, data_dict[key])
+            self._dirty = True
 
-    def _publish(self, num_events):
+    def _snapshot(self):
+        return self._back('dense', self.dense)
+
+    def _render(self, snap, num_events):
         img = Image(
             num_events,
             self.name,
-            np.log10(np.rot90(self.dense + 1e-5))
+            np.log10(np.rot90(snap + 1e-5))
         )
         publish.send(self.name, img)
 
@@ -117,11 +157,13 @@ class Hist2DPlot(BasePlot):
 class RollAvgPlot(BasePlot):
     def __init__(self, name, p):
         super().__init__(name)
-        # config: p['window'] = {'w1':…, 'w2':…}
+        # config: p['window'] = {'w1':…, 'w2':…}, optional p['band'] for a ±std band
         w1 = p['window']['w1']
         w2 = p['window']['w2']
-        self.window  = deque(maxlen=w1)
-        self.history = deque(maxlen=w2)
+        self.band    = bool(p.get('band', False))
+        # sum of the last w1 worker aggregate records
+        self.window  = rolling_sum(w1)
+        self.history = rolling_sum(w2)
         
     def _reset(self):
         self.window.clear()
@@ -130,124 +172,132 @@ class RollAvgPlot(BasePlot):
     def _accumulate(self, data_dict):
         key = self.name
         if key in data_dict:
-            self.window.append(data_dict[key])
+            self.window.append(as_aggregate(data_dict[key]))
+            self._dirty = True
 
-    def _publish(self, num_events):
+    def _snapshot(self):
         if not self.window:
-            return
-        avg = np.mean(self.window)
-        self.history.append(avg)
-
-        plot = XYPlot(
-            num_events,
-            self.name,
-            xdata=np.arange(len(self.history)),
-            ydata=list(self.history),
-            formats=['-']
-        )
+            return None
+        avg, std = aggregate_stats(self.window.sum)
+        self.history.append((avg, std) if self.band else avg)
+        return self.history.rows()
+
+    def _render(self, snap, num_events):
+        x = np.arange(len(snap))
+        if self.band:
+            avg, std = snap[:, 0], snap[:, 1]
+            plot = XYPlot(
+                num_events,
+                self.name,
+                [x, x, x],
+                [avg, avg + std, avg - std],
+                formats=['-', '--', '--']
+            )
+        else:
+            plot = XYPlot(
+                num_events,
+                self.name,
+                xdata=x,
+                ydata=snap,
+                formats=['-']
+            )
         publish.send(self.name, plot)
 
 
 class ScanVarPlot(BasePlot):
     def __init__(self, name, p):
         super().__init__(name)
-        # p may contain var/scan/decimals/norm but gatherer ignores them
-        self.keys    = []
-        self.idx_map = {}
-        self.sums    = np.zeros((0,), float)
-        self.counts  = np.zeros((0,), float)
+        # p may contain var/scan/decimals/norm but gatherer ignores them; optional p['band'] for a ±std band
+        self.band    = bool(p.get('band', False))
+        self.axis    = scan_key_axis()
+        # one aggregate record per scan key
+        self.agg     = np.zeros((0, AGG_SIZE), float)
         
     def _reset(self):
-        self.keys.clear()
-        self.idx_map.clear()
-        self.sums = np.zeros((0,), float)
-        self.counts = np.zeros((0,), float)
+        self.axis.reset()
+        self.agg.fill(0.0)
 
     def _accumulate(self, data_dict):
         key = self.name
         if key not in data_dict:
             return
-        sorted_local, sums_local, counts_local = data_dict[key]
-        for v in sorted_local:
-            if v not in self.idx_map:
-                pos = bisect_left(self.keys, v)
-                self.keys.insert(pos, v)
-                self.sums = np.insert(self.sums, pos, 0.0)
-                self.counts = np.insert(self.counts, pos, 0.0)
-                self.idx_map = {k: i for i, k in enumerate(self.keys)}
-        idxs = np.array([self.idx_map[v] for v in sorted_local], dtype=int)
-        self.sums[idxs] += sums_local
-        self.counts[idxs] += counts_local
+        sorted_local, agg_local = data_dict[key]
+        idxs = self.axis.slots(sorted_local)
+        self.agg = self.axis.fit(self.agg)
+        self.agg[idxs] += agg_local
+        self._dirty = True
 
     def calc(self):
-        if self.sums.size == 0:
+        if self.axis.size == 0:
             return None, None
-
-        means = self.sums / self.counts
-            
-        return self.keys, means   
+        means, _ = aggregate_stats(self.agg[self.axis.order()])
+        return self.axis.sorted_keys(), means
         
-    def _publish(self, num_events):
-        if self.sums.size == 0:
-            return
-        means = self.sums / self.counts
-        plot = XYPlot(
-            num_events,
-            self.name,
-            self.keys,
-            means
-        )
+    def _snapshot(self):
+        if self.axis.size == 0:
+            return None
+        return self.axis.sorted_keys(), self.agg[self.axis.order()]
+
+    def _render(self, snap, num_events):
+        keys, agg = snap
+        avg, std = aggregate_stats(agg)
+        if self.band:
+            plot = XYPlot(
+                num_events,
+                self.name,
+                [keys, keys, keys],
+                [avg, avg + std, avg - std],
+                formats=['-', '--', '--']
+            )
+        else:
+            plot = XYPlot(
+                num_events,
+                self.name,
+                keys,
+                avg
+            )
         publish.send(self.name, plot)
 
 
 class Scan2VarPlot(BasePlot):
     def __init__(self, name, p):
         super().__init__(name)
-        self.keys1    = []
-        self.keys2    = []
-        self.idx1_map = {}
-        self.idx2_map = {}
+        self.axis1    = scan_key_axis()
+        self.axis2    = scan_key_axis()
         self.sums     = np.zeros((0, 0), float)
         self.counts   = np.zeros((0, 0), float)
 
     def _reset(self):
-        self.keys1.clear()
-        self.keys2.clear()
-        self.idx1_map.clear()
-        self.idx2_map.clear()
-        self.sums = np.zeros((0, 0), float)
-        self.counts = np.zeros((0, 0), float)
+        self.axis1.reset()
+        self.axis2.reset()
+        self.sums.fill(0.0)
+        self.counts.fill(0.0)
 
     def _accumulate(self, data_dict):
         key = self.name
         if key not in data_dict:
             return
         k1, k2, sums_local, counts_local = data_dict[key]
-        for v in np.unique(k1):
-            if v not in self.idx1_map:
-                pos = bisect_left(self.keys1, v)
-                self.keys1.insert(pos, v)
-                self.sums = np.insert(self.sums, pos, 0.0, axis=0)
-                self.counts = np.insert(self.counts, pos, 0.0, axis=0)
-                self.idx1_map = {k: i for i, k in enumerate(self.keys1)}
-        for v in np.unique(k2):
-            if v not in self.idx2_map:
-                pos = bisect_left(self.keys2, v)
-                self.keys2.insert(pos, v)
-                self.sums = np.insert(self.sums, pos, 0.0, axis=1)
-                self.counts = np.insert(self.counts, pos, 0.0, axis=1)
-                self.idx2_map = {k: j for j, k in enumerate(self.keys2)}
-        G1, G2 = self.sums.shape
-        rows = np.repeat([self.idx1_map[v] for v in k1], len(k2))
-        cols = np.tile([self.idx2_map[v] for v in k2], len(k1))
-        np.add.at(self.sums, (rows, cols), sums_local.ravel())
-        np.add.at(self.counts, (rows, cols), counts_local.ravel())
-
-    def _publish(self, num_events):
-        if self.sums.size == 0:
-            return
-        mean_mat = self.sums / self.counts
-        img = Image(num_events, self.name, mean_mat)
+        # worker keys are unique, so the fancy-indexed += does not drop repeats
+        rows = self.axis1.slots(k1)
+        cols = self.axis2.slots(k2)
+        for name in ('sums', 'counts'):
+            arr = self.axis2.fit(self.axis1.fit(getattr(self, name), axis=0), axis=1)
+            setattr(self, name, arr)
+        ix = np.ix_(rows, cols)
+        self.sums[ix] += sums_local
+        self.counts[ix] += counts_local
+        self._dirty = True
+
+    def _snapshot(self):
+        if self.axis1.size == 0 or self.axis2.size == 0:
+            return None
+        ix = np.ix_(self.axis1.order(), self.axis2.order())
+        return self.sums[ix], self.counts[ix]
+
+    def _render(self, snap, num_events):
+        sums, counts = snap
+        img = Image(num_events, self.name, sums / counts)
         publish.send(self.name, img)
 
 
@@ -259,39 +309,36 @@ class ScanHist1DPlot(BasePlot):
         # compute number of bins
         bin_count = int((stop - start) / step)
         self.bin_count = bin_count
-        self.keys      = []
-        self.idx_map   = {}
+        self.axis      = scan_key_axis()
         self.matrix    = np.zeros((0, bin_count), dtype=int)
         self.counts    = np.zeros((0,), dtype=float)
         
     def _reset(self):
-        self.keys.clear()
-        self.idx_map.clear()
-        self.matrix = np.zeros((0, self.bin_count), dtype=int)
-        self.counts = np.zeros((0,), dtype=float)
+        self.axis.reset()
+        self.matrix.fill(0)
+        self.counts.fill(0.0)
 
     def _accumulate(self, data_dict):
         key = self.name
         if key not in data_dict:
             return
         H_sp, keys_local, num_arr = data_dict[key]
-        for v in keys_local:
-            if v not in self.idx_map:
-                pos = bisect_left(self.keys, v)
-                self.keys.insert(pos, v)
-                self.matrix = np.insert(self.matrix, pos, 0, axis=0)
-                self.counts = np.insert(self.counts, pos, 0.0)
-                self.idx_map = {k: i for i, k in enumerate(self.keys)}
-        rows = np.array([self.idx_map[keys_local[r]] for r in H_sp.row], dtype=int)
-        self.matrix[rows, H_sp.col] += H_sp.data
-        for i, v in enumerate(keys_local):
-            self.counts[self.idx_map[v]] += num_arr[i]
-
-    def _publish(self, num_events):
-        if self.matrix.size == 0:
-            return
-        scan_normed = self.matrix / self.counts[:, None]
-        img = Image(num_events, self.name, scan_normed)
+        rows = self.axis.slots(keys_local)
+        self.matrix = self.axis.fit(self.matrix)
+        self.counts = self.axis.fit(self.counts)
+        gather_dense_sort1d(self.matrix, H_sp, rows)
+        self.counts[rows] += num_arr
+        self._dirty = True
+
+    def _snapshot(self):
+        if self.axis.size == 0:
+            return None
+        order = self.axis.order()
+        return self.matrix[order], self.counts[order]
+
+    def _render(self, snap, num_events):
+        matrix, counts = snap
+        img = Image(num_events, self.name, matrix / counts[:, None])
         publish.send(self.name, img)
 
 
@@ -311,6 +358,7 @@ class SingleLinePlot(BasePlot):
             arr = np.asarray(data_dict[self.name])
             if self.centers is None: self.centers= np.arange(arr.size)
             self.dense = arr
+            self._dirty = True
 
     def calc(self):
         if self.dense is None or self.dense.size == 0:
@@ -318,14 +366,19 @@ class SingleLinePlot(BasePlot):
             
         return self.centers, self.dense    
     
-    def _publish(self, num_events: int):# -> None:
+    def _snapshot(self):
+        # dense is replaced, not modified, by _accumulate
         if self.dense is None or self.dense.size == 0:
-            return
+            return None
+        return self.centers, self.dense
+
+    def _render(self, snap, num_events: int):# -> None:
+        centers, dense = snap
         plot = XYPlot(
             num_events,
             self.name,
-            self.centers,
-            self.dense,
+            centers,
+            dense,
             formats=['-']
         )
         publish.send(self.name, plot)
@@ -342,14 +395,16 @@ class SingleImagePlot(BasePlot):
         if self.name in data_dict:
             # no checks, assume caller passed a valid 2D array
             self.dense = data_dict[self.name]
+            self._dirty = True
 
-    def _publish(self, num_events: int):# -> None:
-        if self.dense is None:
-            return
+    def _snapshot(self):
+        return self.dense
+
+    def _render(self, snap, num_events: int):# -> None:
         img = Image(
             num_events,
             self.name,
-            self.dense
+            snap
         )
         publish.send(self.name, img)
 
@@ -405,17 +460,22 @@ class SigBkg1DPlot(BasePlot):
         # pass through to sub-plots
         self.plot_sig._accumulate(data_dict)
         self.plot_bkg._accumulate(data_dict)
+        if self.plot_sig._dirty or self.plot_bkg._dirty:
+            self._dirty = True
+            self.plot_sig._dirty = self.plot_bkg._dirty = False
 
-    def _publish(self, num_events: int):# -> None:
-        # let sub-plots prepare their plots
-        self.numevents = num_events
-        # publish individual lines into cached arrays
-        # extract arrays
+    def _snapshot(self):
+        # extract arrays; copies, since calc may return live state
         x_sig, sig = self.plot_sig.calc()
         x_bkg, bkg = self.plot_bkg.calc()
         # if either missing, skip
         if sig is None or bkg is None:
-            return
+            return None
+        return np.array(x_sig), np.array(sig), np.array(x_bkg), np.array(bkg)
+
+    def _render(self, snap, num_events: int):# -> None:
+        self.numevents = num_events
+        x_sig, sig, x_bkg, bkg = snap
         # build series
         x_arrays = [x_sig, x_bkg]
         y_arrays = [sig, bkg]
@@ -452,7 +512,7 @@ class RollAvg1DPlot(BasePlot):
         # config: p['window'] = integer
         window = p['window']
         self.window  = window
-        self.buffer  = deque(maxlen=window)
+        self.buffer  = rolling_sum(window)
         self.centers = None
 
     def _reset(self):# -> None:
@@ -467,29 +527,27 @@ class RollAvg1DPlot(BasePlot):
             # first time: set up x‑axis
             self.centers = np.arange(arr.size)
 
-        if len(arr)>0: self.buffer.append(arr)
+        if len(arr)>0:
+            self.buffer.append(arr)
+            self._dirty = True
 
     def calc(self):
         if not self.buffer:
             return None, None
-        # stack and compute mean along axis 0
-        stacked   = np.stack(self.buffer, axis=0)
-        mean_arr  = stacked.mean(axis=0)
-            
-        return self.centers, mean_arr
+        # running mean over the window, O(length)
+        return self.centers, self.buffer.mean()
     
-    def _publish(self, num_events: int):# -> None:
+    def _snapshot(self):
         if not self.buffer:
-            return
-        # stack and compute mean along axis 0
-     
-        stacked   = np.stack(self.buffer, axis=0)
-        mean_arr  = stacked.mean(axis=0)
+            return None
+        return self.buffer.mean(out=self._back('mean', self.buffer.sum))
+
+    def _render(self, snap, num_events: int):# -> None:
         plot = XYPlot(
             num_events,
             self.name,
             self.centers,
-            mean_arr,
+            snap,
             formats=['-']
         )
         
@@ -524,6 +582,7 @@ class Hist1DFuncPlot(BasePlot):
         if data_dict[f'valid_{self.name}']:           
             if key_h in data_dict:
                 gather_dense_hist1d_fast(self.dense, data_dict[key_h])
+            self._dirty = True
             if self.norm_type:
                 key_n = f'norm_{self.name}'
                 if key_n in data_dict:
@@ -539,11 +598,15 @@ class Hist1DFuncPlot(BasePlot):
             plot_data = self.dense           
         return self.centers, plot_data
 
-    def _publish(self, num_events: int):# -> None:
-        if self.norm_type and self.norm_sum > 0:
-            plot_data = self.dense / self.norm_sum
+    def _snapshot(self):
+        return self._back('dense', self.dense), self.norm_sum
+
+    def _render(self, snap, num_events: int):# -> None:
+        dense, norm_sum = snap
+        if self.norm_type and norm_sum > 0:
+            plot_data = dense / norm_sum
         else:
-            plot_data = self.dense
+            plot_data = dense
         plot = XYPlot(
             num_events,
             self.name,
@@ -1,9 +1,14 @@
 from dream.util.histogram import (
-    worker_sparse_mean_sort,
     worker_sparse_mean_sort2d,
-    worker_sparse_sort1d_fast,
-    worker_sparse_hist1d_fast,
-    worker_sparse_hist2d_fast
+    worker_hist1d,
+    worker_hist2d,
+    worker_sort1d,
+    bin_index,
+    hist1d_from_index,
+    hist2d_from_index,
+    sort1d_from_index,
+    worker_aggregate,
+    worker_group_aggregate
 )
 
 import numpy as np
@@ -14,11 +19,25 @@ sys.path.insert(0, custom_dir)
 from dream.util.misc import mk_func
 
 class BaseWorkerPlot:
+    axes = ()   # (var, edges) of the directly binned variables
+
     def __init__(self, name):
         self.name = name
+        self.cache = None
     def accumulate(self, data_acc, out_dict):
         raise NotImplementedError
 
+    def bind(self, cache):
+        # share bin indices with the other plots through comm_online's axis_cache
+        self.cache = cache
+        self.axis_keys = [cache.register(var, edges) for var, edges in self.axes]
+
+    def axis_index(self, data_acc, i):
+        if self.cache is None:
+            var, edges = self.axes[i]
+            return bin_index(np.atleast_1d(data_acc[var]), edges)
+        return self.cache.index(data_acc, self.axis_keys[i])
+
 
 class MultiLineWorkerPlot(BaseWorkerPlot):
     def __init__(self, name, p):
@@ -46,7 +65,7 @@ class RollAvgWorkerPlot(BaseWorkerPlot):
             arr = np.atleast_1d(data_acc[self.var])
             arr = arr[arr>0]
             if len(arr)<=0: return
-            out_dict[self.name] = np.mean(arr)
+            out_dict[self.name] = worker_aggregate(arr)
 
 
 class ScanVarWorkerPlot(BaseWorkerPlot):
@@ -65,8 +84,7 @@ class ScanVarWorkerPlot(BaseWorkerPlot):
             arr_scan = np.atleast_1d(data_acc[self.scan])
             if np.isnan(arr_scan).any(): return
             arr_norm = None if self.norm is None else np.atleast_1d(data_acc[self.norm])
-            keys, sums, counts = worker_sparse_mean_sort(arr, arr_scan, self.decimals, arr_norm)
-            out_dict[self.name] = (keys, sums, counts)
+            out_dict[self.name] = worker_group_aggregate(arr, arr_scan, self.decimals, arr_norm)
 
 
 class Scan2VarWorkerPlot(BaseWorkerPlot):
@@ -102,14 +120,20 @@ class ScanHist1DWorkerPlot(BaseWorkerPlot):
         dec = p.get('decimals', p.get('decimal'))
         self.decimals = dec
         self.norm = p.get('norm')
+        self.encoding = p.get('encoding', 'auto')
+        self.axes = [(self.var, self.edges)]
 
     def accumulate(self, data_acc, out_dict):
         if self.var in data_acc and self.scan in data_acc:
-            arr = np.atleast_1d(data_acc[self.var])
             arr_scan = np.atleast_1d(data_acc[self.scan])
             if np.isnan(arr_scan).any(): return
+            bins, mask = self.axis_index(data_acc, 0)
+            if bins.shape != arr_scan.shape:
+                raise ValueError("`data` and `scan` must have the same shape")
             arr_norm = None if self.norm is None else np.atleast_1d(data_acc[self.norm])
-            H_sp, keys, num_arr = worker_sparse_sort1d_fast(arr, arr_scan, self.edges, self.decimals, arr_norm)
+            if arr_norm is not None and arr_norm.shape != bins.shape:
+                raise ValueError("`arr_norm` must match input shapes")
+            H_sp, keys, num_arr = sort1d_from_index(bins, mask, arr_scan, self.edges.size - 1, self.decimals, arr_norm, self.encoding)
             out_dict[self.name] = (H_sp, keys, num_arr)
 
 
@@ -119,11 +143,13 @@ class Hist1DWorkerPlot(BaseWorkerPlot):
         var = next(iter(p['arange']))
         self.var = var
         self.edges = np.arange(*p['arange'][var])
+        self.encoding = p.get('encoding', 'auto')
+        self.axes = [(self.var, self.edges)]
 
     def accumulate(self, data_acc, out_dict):
         if self.var in data_acc:
-            arr = np.atleast_1d(data_acc[self.var])
-            H_sp, _ = worker_sparse_hist1d_fast(arr, self.edges)
+            idx, mask = self.axis_index(data_acc, 0)
+            H_sp = hist1d_from_index(idx, mask, self.edges.size - 1, self.encoding)
             out_dict[self.name] = H_sp
 
 
@@ -134,12 +160,14 @@ class Hist2DWorkerPlot(BaseWorkerPlot):
         self.kx, self.ky = keys[0], keys[1]
         self.xedges = np.arange(*p['arange'][self.kx])
         self.yedges = np.arange(*p['arange'][self.ky])
+        self.encoding = p.get('encoding', 'auto')
+        self.axes = [(self.kx, self.xedges), (self.ky, self.yedges)]
 
     def accumulate(self, data_acc, out_dict):
         if self.kx in data_acc and self.ky in data_acc:
-            x = np.atleast_1d(data_acc[self.kx])
-            y = np.atleast_1d(data_acc[self.ky])
-            H_sp, _, _ = worker_sparse_hist2d_fast(x, y, self.xedges, self.yedges)
+            ix, mx = self.axis_index(data_acc, 0)
+            iy, my = self.axis_index(data_acc, 1)
+            H_sp = hist2d_from_index(ix, mx, iy, my, self.xedges.size - 1, self.yedges.size - 1, self.encoding)
             out_dict[self.name] = H_sp
 
 
@@ -219,11 +247,11 @@ class SigBkg1DWorker(BaseWorkerPlot):
         elif plot_type == 'hist1d_func':
             # histogram transform for signal and background
             arange = p['arange_var']
-            nsig = {'func': fsig, 'arange_var': arange}
+            nsig = {'func': fsig, 'arange_var': arange, 'encoding': p.get('encoding', 'auto')}
             if 'func_norm_sig' in p:
                 nsig['func_norm'] = p['func_norm_sig']
                 nsig['norm_type'] = p.get('norm_type')
-            nbkg = {'func': fbkg, 'arange_var': arange}
+            nbkg = {'func': fbkg, 'arange_var': arange, 'encoding': p.get('encoding', 'auto')}
             if 'func_norm_bkg' in p:
                 nbkg['func_norm'] = p['func_norm_bkg']
                 nbkg['norm_type'] = p.get('norm_type')
@@ -233,6 +261,11 @@ class SigBkg1DWorker(BaseWorkerPlot):
         else:
             raise ValueError(f"Unknown plot_type '{plot_type}'")
 
+    def bind(self, cache):
+        super().bind(cache)
+        self.worker_sig.bind(cache)
+        self.worker_bkg.bind(cache)
+
     def accumulate(self, data_acc, out_dict):
         self.worker_sig.accumulate(data_acc, out_dict)
         self.worker_bkg.accumulate(data_acc, out_dict)
@@ -286,6 +319,7 @@ class Hist1DFuncWorkerPlot(BaseWorkerPlot):
    
         start, stop, step = next(iter(p['arange_var'].values()))  
         self.edges = np.arange(start, stop, step)
+        self.encoding = p.get('encoding', 'auto')
         
         self.norm_type = p.get('norm_type')
         if self.norm_type:
@@ -302,7 +336,7 @@ class Hist1DFuncWorkerPlot(BaseWorkerPlot):
         if arr is None: 
             out_dict[f'valid_{self.name}'] = False
             return
-        H_sp, _ = worker_sparse_hist1d_fast(np.atleast_1d(arr), self.edges)
+        H_sp = worker_hist1d(np.atleast_1d(arr), self.edges, self.encoding)
         out_dict[f'h1_{self.name}'] = H_sp
         if self.norm_type:
             args_n = [np.atleast_1d(data_acc[k]) for k in self.func_args1_norm if k in data_acc]
@@ -331,7 +365,7 @@ class RollAvgFuncWorkerPlot(BaseWorkerPlot):
         if arr is None: return
         arr = arr[arr>0]
         if len(arr)<=0: return
-        out_dict[self.name] = np.mean(np.atleast_1d(arr))
+        out_dict[self.name] = worker_aggregate(arr)
 
 
 class ScanVarFuncWorkerPlot(BaseWorkerPlot):
@@ -378,10 +412,9 @@ class ScanVarFuncWorkerPlot(BaseWorkerPlot):
         if inds_nan.sum()<=0: 
             return
         if arr_norm is None:
-            keys, sums, counts = worker_sparse_mean_sort(arr[inds_nan], arr_scan[inds_nan], self.decimals, arr_norm)
+            out_dict[self.name] = worker_group_aggregate(arr[inds_nan], arr_scan[inds_nan], self.decimals, arr_norm)
         else:
-            keys, sums, counts = worker_sparse_mean_sort(arr[inds_nan], arr_scan[inds_nan], self.decimals, arr_norm[inds_nan])
-        out_dict[self.name] = (keys, sums, counts)
+            out_dict[self.name] = worker_group_aggregate(arr[inds_nan], arr_scan[inds_nan], self.decimals, arr_norm[inds_nan])
 
 
 class Scan2VarFuncWorkerPlot(BaseWorkerPlot):
@@ -486,6 +519,7 @@ class ScanHist1DFuncWorkerPlot(BaseWorkerPlot):
         self.edges = np.arange(*ar)
         # decimals for grouping
         self.decimals = p.get('decimals', p.get('decimal', 5))
+        self.encoding = p.get('encoding', 'auto')
         # optional normalization
         fn = p.get('func_norm')
         if fn:
@@ -527,13 +561,13 @@ class ScanHist1DFuncWorkerPlot(BaseWorkerPlot):
             return
         if arr_norm is None:            
             # compute sparse histogram
-            H_sp, keys, counts = worker_sparse_sort1d_fast(
-                arr[inds_nan], arr_scan[inds_nan], self.edges, self.decimals, arr_norm
+            H_sp, keys, counts = worker_sort1d(
+                arr[inds_nan], arr_scan[inds_nan], self.edges, self.decimals, arr_norm, self.encoding
             )
         else:
             # compute sparse histogram
-            H_sp, keys, counts = worker_sparse_sort1d_fast(
-                arr[inds_nan], arr_scan[inds_nan], self.edges, self.decimals, arr_norm[inds_nan]
+            H_sp, keys, counts = worker_sort1d(
+                arr[inds_nan], arr_scan[inds_nan], self.edges, self.decimals, arr_norm[inds_nan], self.encoding
             )            
         out_dict[self.name] = (H_sp, keys, counts)
 
@@ -558,6 +592,7 @@ class Hist2DFuncWorkerPlot(BaseWorkerPlot):
         xkey, ykey = keys[0], keys[1]
         self.xedges = np.arange(*ar[xkey])
         self.yedges = np.arange(*ar[ykey])
+        self.encoding = p.get('encoding', 'auto')
 
     def accumulate(self, data_acc: dict, out_dict: dict):# -> None:
         # compute x values
@@ -575,5 +610,5 @@ class Hist2DFuncWorkerPlot(BaseWorkerPlot):
             args_y.append(np.atleast_1d(data_acc[k]))
         y = np.atleast_1d(self.func_y(*args_y, *self.func_args2_y))
         # compute 2D sparse histogram
-        H_sp2d, _, _ = worker_sparse_hist2d_fast(x, y, self.xedges, self.yedges)
+        H_sp2d = worker_hist2d(x, y, self.xedges, self.yedges, self.encoding)
         out_dict[self.name] = H_sp2d
@@ -0,0 +1,97 @@
+import numpy as np
+
+
+class run_file:
+    """
+    Reader for dream offline HDF5 files.
+
+    x variables are stored per event under 'x/', ragged groups per hit under
+    'ragged/var_<k>/' with the hits per event in 'ragged/var_<k>_len'.
+    `hits(k, name)` gives a per-hit column for both layouts: columns written
+    with `xpand: True` are returned as stored, x variables written once
+    (`xpand: False`) are expanded on access through the per-hit event index.
+    """
+    def __init__(self, path):
+        import h5py
+        self.file = h5py.File(path, 'r') if isinstance(path, str) else path
+        self._index = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def groups(self):
+        return [name[4:] for name in self.file.get('ragged', {}) if name.startswith('var_') and not name.endswith('_len')]
+
+    def lengths(self, k: str) -> np.ndarray:
+        return self.file[f'ragged/var_{k}_len'][()]
+
+    def offsets(self, k: str) -> np.ndarray:
+        """Start of each event's hits, with the total as last entry."""
+        lengths = self.lengths(k)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return offsets
+
+    def event_index(self, k: str) -> np.ndarray:
+        """Event row of every hit of group `k`."""
+        index = self._index.get(k)
+        if index is None:
+            lengths = self.lengths(k)
+            index = self._index[k] = np.repeat(np.arange(len(lengths)), lengths)
+        return index
+
+    def order(self) -> np.ndarray:
+        """Event rows in timestamp order, from the merge index when there is one."""
+        if 'index/order' in self.file:
+            return self.file['index/order'][()]
+        return np.argsort(self.file['timestamp'][()], kind='stable')
+
+    def x(self, name: str):
+        return self.file['x/' + name]
+
+    def hits(self, k: str, name: str):
+        stored = f'ragged/var_{k}/{name}'
+        if stored in self.file:
+            return self.file[stored]
+        return expanded(self.x(name), self.event_index(k))
+
+
+class expanded:
+    """
+    Per-hit view of a per-event column: hit i is row `index[i]` of `column`.
+    Nothing is read until it is indexed; the per-event column is then loaded
+    once and hits are gathered from it.
+    """
+    def __init__(self, column, index: np.ndarray):
+        self.column = column
+        self.index = index
+        self._values = None
+
+    @property
+    def shape(self):
+        return (len(self.index),) + tuple(self.column.shape[1:])
+
+    @property
+    def dtype(self):
+        return self.column.dtype
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def values(self) -> np.ndarray:
+        if self._values is None:
+            self._values = np.asarray(self.column[()])
+        return self._values
+
+    def __getitem__(self, sel):
+        return self.values()[self.index[sel]]
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.values()[self.index]
+        return out if dtype is None else out.astype(dtype, copy=False)
@@ -0,0 +1,142 @@
+from typing import Any, Dict, Iterable, List
+from dream.util.misc import head_match
+
+# groups whose values are only kept as latest value (waveforms, lines, ...)
+LATEST_PREFIXES = ['wf', 'pdd', 'atm', 'fzp']
+
+
+class event_record:
+    """
+    Flat per-event record with one fixed slot per requested 'prefix:var' name.
+
+    Slots are laid out once from `requested_vars_by_detector`; names listed in
+    `x_names` (plus 'timestamp') are event-level x scalars, everything else
+    belongs to its prefix group. Algorithms write into `values` by slot index
+    (see `index`) or hand a nested {k1: {k2: value}} output to `absorb`, which
+    resolves slots through a precomputed lookup table. Unwritten slots are None.
+
+    The routing used by comm (x, accumulated, latest-value) is computed here once
+    per slot instead of per event.
+    """
+
+    def __init__(self, requested_vars_by_detector: Dict[str, Dict[str, List[str]]], x_names: Iterable[str] = ()):
+        x_names = set(x_names)
+        self.names = ['timestamp']
+        self.index = {'timestamp': 0}
+        self.table = {'x': {'timestamp': 0}}
+        for detector in requested_vars_by_detector.values():
+            for k1, sub in detector.items():
+                for k2 in sub:
+                    name = f"{k1}:{k2}"
+                    if name in self.index: continue
+                    self.index[name] = len(self.names)
+                    self.names.append(name)
+                    if name in x_names:
+                        self.table['x'][name] = self.index[name]
+                    else:
+                        self.table.setdefault(k1, {})[k2] = self.index[name]
+        self._none = [None]*len(self.names)
+        self.values = list(self._none)
+
+        self.x_slots = [(i, name) for name, i in self.table['x'].items()]
+        self.acc_slots = [(i, name) for i, name in self.x_slots if name != 'timestamp']
+        self.latest_slots = []
+        for k1, sub in self.table.items():
+            if k1 == 'x': continue
+            slots = [(i, self.names[i]) for i in sub.values()]
+            if head_match(k1.split('_')[0], LATEST_PREFIXES):
+                self.latest_slots += slots
+            else:
+                self.acc_slots += slots
+
+    def clear(self) -> None:
+        # in place, so views holding `values` stay valid
+        self.values[:] = self._none
+
+    def absorb(self, out: Dict[str, Dict[str, Any]]) -> None:
+        """Write a nested algorithm output into the record; unrequested keys are ignored."""
+        values = self.values
+        table = self.table
+        for k1, sub in out.items():
+            slots = table.get(k1)
+            if slots is None: continue
+            for k2, v in sub.items():
+                i = slots.get(k2)
+                if i is not None: values[i] = v
+
+    def x_dict(self) -> Dict[str, Any]:
+        values = self.values
+        return {name: values[i] for i, name in self.x_slots if values[i] is not None}
+
+    def __getitem__(self, key: str):
+        # full 'prefix:var' (or 'timestamp') -> value, group prefix -> group view
+        i = self.index.get(key)
+        if i is not None:
+            return self.values[i]
+        if key in self.table:
+            return record_group(self, self.table[key])
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.index or key in self.table
+
+
+class record_group:
+    """Mapping view of one prefix group of an event_record; unset slots are absent."""
+    __slots__ = ('values', 'slots')
+
+    def __init__(self, record: event_record, slots: Dict[str, int]):
+        self.values = record.values
+        self.slots = slots
+
+    def __getitem__(self, k2: str):
+        v = self.values[self.slots[k2]]
+        if v is None:
+            raise KeyError(k2)
+        return v
+
+    def __contains__(self, k2) -> bool:
+        i = self.slots.get(k2)
+        return i is not None and self.values[i] is not None
+
+    def keys(self):
+        return [k2 for k2, i in self.slots.items() if self.values[i] is not None]
+
+    def items(self):
+        return [(k2, self.values[i]) for k2, i in self.slots.items() if self.values[i] is not None]
+
+
+def batch_outputs(fillers, events):
+    """
+    Outputs of `events` for every filler whose algorithm has a process_batch, in
+    filler order (None for the others). An algorithm that fails on the batch also
+    gets None and is then run event by event, so only its bad events are lost.
+    """
+    outputs = []
+    for alg, det, direct in fillers:
+        out = None
+        if not direct and hasattr(alg, 'process_batch'):
+            try:
+                out = alg.process_batch(det, events)
+            except Exception as err:
+                print(err)
+        outputs.append(out)
+    return outputs
+
+
+def fill_event(record: event_record, fillers, evt, batch=None, i: int = 0) -> None:
+    """
+    Fill `record` for one event. `fillers` is a list of (callable, det, direct):
+    direct callables write into the record themselves, the others return a nested
+    output that is absorbed. With `batch` (see batch_outputs), algorithms that
+    have one take their output for event `i` from it.
+    """
+    record.clear()
+    record.values[0] = evt.timestamp
+    for j, (alg, det, direct) in enumerate(fillers):
+        if batch is not None and batch[j] is not None:
+            record.absorb(batch[j][i])
+        elif direct:
+            alg(record, det, evt)
+        else:
+            record.absorb(alg(det, evt, record))
@@ -1,6 +1,5 @@
 from typing import Any
 import copy
-from psana import DataSource
 
 DetectorReturnMap = dict[str, list[str]]          # prefix -> trailing names
 DetectorMap = dict[str, DetectorReturnMap]        # detector -> return map
@@ -166,11 +165,25 @@ def check_detectors(
     return needed, updated, requested
 
 
+def data_source(config, **kwargs):
+    # psana is only imported when the synthetic stand-in is not selected
+    from dream.util import synthetic
+    if synthetic.enabled():
+        return synthetic.DataSource(synthetic=config.get('synthetic'), **kwargs)
+    from psana import DataSource
+    return DataSource(**kwargs)
+
+
+def h5_file(config, exp, run_num):
+    h5 = config['h5']
+    return h5['path1'] + exp + h5['path2'] + h5['name1'] + str(run_num) + h5['name2']
+
+
 def init(rank, mode, exp, run_num, config, callbacks):
     if mode == 'offline':
         import os, glob
         h5_dir = config['h5']['path1'] + exp + config['h5']['path2']
-        h5_path = h5_dir + config['h5']['name1'] + str(run_num) + config['h5']['name2']        
+        h5_path = h5_file(config, exp, run_num)
         permissions_mode = 0o775
         os.makedirs(h5_dir, mode=permissions_mode, exist_ok=True)                
         log_dir = config['log']['path1'] + exp + config['log']['path2']   
@@ -190,16 +203,28 @@ def init(rank, mode, exp, run_num, config, callbacks):
 
         
         if config['max_events'] is not None:
-            ds = DataSource(exp=exp,run=run_num, live = config['live'], max_events=config['max_events'], monitor=False) 
+            ds = data_source(config, exp=exp,run=run_num, live = config['live'], max_events=config['max_events'], monitor=False) 
         else:
-            ds = DataSource(exp=exp,run=run_num, live = config['live'], monitor=False)             
+            ds = data_source(config, exp=exp,run=run_num, live = config['live'], monitor=False)             
         
-        smd = ds.smalldata(filename=h5_path, batch_size=config['batch_size'])
+        if config.get('writer', 'smalldata') == 'dream':
+            # per-rank columnar files, merged into h5_path at smd.done()
+            from dream.util.writer import columnar_writer, column_filters
+            smd = columnar_writer(h5_path, batch_size=config['batch_size'],
+                                  compression=config.get('compression'), compression_opts=config.get('compression_opts'),
+                                  rank=rank, size=int(os.getenv("OMPI_COMM_WORLD_SIZE", 1)),
+                                  index=config.get('merge_index', False), filters=column_filters(config['data']))
+        else:
+            smd = ds.smalldata(filename=h5_path, batch_size=config['batch_size'])
+            if config.get('merge', False):
+                # replace the gathered file by a virtual-dataset merge of the part files
+                from dream.util.merge import merge_at_done
+                smd = merge_at_done(smd, h5_path, rank, index=config.get('merge_index', False))
 
     elif mode == 'online':
         # ds = DataSource(shmem='tmo_meb1')
         ###
-        ds = DataSource(exp='tmo101247125',run=91)             
+        ds = data_source(config, exp='tmo101247125',run=91)             
         #####
         smd = ds.smalldata(batch_size=1, callbacks=callbacks)        
     return ds, smd
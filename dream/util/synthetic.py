@@ -0,0 +1,407 @@
+"""
+Synthetic stand-in for the subset of psana used by dream.
+
+Selected with `dream --synthetic` or DREAM_SYNTHETIC=1. Detector geometry and
+CFD settings come from alg.yaml (CONFIGDIR), the event model from the optional
+`synthetic` section of online.yaml/offline.yaml:
+
+    synthetic:
+      events: 1000      # events per run
+      steps: 1          # scan steps per run
+      hits: 5           # mean DLD hit multiplicity at the mean pulse energy
+      seed: 0
+
+Every event is generated from a generator seeded with (seed, run, event), so runs
+are reproducible and independent of which detectors are read.
+"""
+import os
+import zlib
+import numpy as np
+from dream.util.misc import read_config
+from dream.alg.common.peak_finders import FEX_DT
+
+EVENT_PERIOD_NS = 1_000_000_000 // 120
+
+BLD_NAMES = ['gmd', 'xgmd']
+SCAN_NAMES = ['lxt', 'lxt_vitara']
+EPICS_NAMES = ['las_ip2_atm_dly']
+# ion species (mass/charge) and a TOF scale so that t = tof_scale*sqrt(m/q) lands in 1-9 us
+SPECIES = np.array([1., 2., 14., 16., 18., 20., 28., 32., 40.])
+TOF_SCALE = 1300.
+
+
+def enabled():
+    return os.getenv('DREAM_SYNTHETIC', '').lower() in ['1', 'true', 'yes', 'y', 't']
+
+
+class DataSource:
+    def __init__(self, exp=None, run=None, max_events=None, synthetic=None, **kwargs):
+        params = synthetic or {}
+        self.exp = exp or 'synthetic'
+        self.run_nums = [run] if run is not None else [1]
+        self.n_events = int(params.get('events', 1000))
+        if max_events is not None: self.n_events = min(self.n_events, int(max_events))
+        self.n_steps = max(int(params.get('steps', 1)), 1)
+        self.mean_hits = float(params.get('hits', 5))
+        self.seed = int(params.get('seed', 0))
+        self.rank = int(os.getenv("OMPI_COMM_WORLD_RANK", 0))
+        self.size = int(os.getenv("OMPI_COMM_WORLD_SIZE", 1))
+
+        config_dir = os.getenv("CONFIGDIR")
+        instrument = read_config(config_dir+'instrument.yaml')['instrument']
+        self.alg_params = read_config(config_dir + instrument + '/alg.yaml')
+
+    def runs(self):
+        for run_num in self.run_nums:
+            yield Run(self, run_num)
+
+    def smalldata(self, filename=None, batch_size=1000, callbacks=[], **kwargs):
+        return SmallData(filename, batch_size, callbacks, self.rank, self.size)
+
+
+class Run:
+    def __init__(self, ds, run_num):
+        self.ds = ds
+        self.runnum = run_num
+        self.expt = ds.exp
+        self.model = EventModel(ds.alg_params, ds.mean_hits)
+
+        self.hsd_names = {}
+        for det_id, p in ds.alg_params.items():
+            if isinstance(p, dict) and 'hr' in p:
+                for k1, vals in p['det']['keys'].items():
+                    self.hsd_names[k1] = (det_id, vals)
+        self.atm_names = list(ds.alg_params.get('atm', {}).get('det', {}).get('keys', []))
+
+        self.detnames = ['timing'] + BLD_NAMES + list(self.hsd_names) + self.atm_names + SCAN_NAMES + EPICS_NAMES
+        # psana layout: step_value, step_docstring, then one entry per scanned motor
+        self.scaninfo = {('step_value', 'raw'): 'raw', ('step_docstring', 'raw'): 'raw'}
+        for name in SCAN_NAMES: self.scaninfo[(name, 'raw')] = 'raw'
+        self.epicsinfo = {(name, name): 'raw' for name in EPICS_NAMES}
+
+    def Detector(self, name):
+        if name in self.hsd_names:
+            det_id, vals = self.hsd_names[name]
+            return Hsd(self.model, det_id, name, vals)
+        if name == 'timing':
+            return Timing(self.model)
+        if name in BLD_NAMES:
+            return Bld(self.model, name)
+        if name in self.atm_names:
+            return Atm(self.model)
+        if name in SCAN_NAMES:
+            return ScanVar(SCAN_NAMES.index(name))
+        if name in EPICS_NAMES:
+            return lambda evt: 1.0 + 1e-3*evt.step
+        raise ValueError(f"No detector named {name}")
+
+    def steps(self):
+        ds = self.ds
+        per_step = -(-ds.n_events // ds.n_steps)
+        for step in range(ds.n_steps):
+            first = step*per_step
+            last = min(first + per_step, ds.n_events)
+            yield Step(self, step, range(first + ds.rank, last, ds.size))
+
+    def events(self):
+        for step in self.steps():
+            yield from step.events()
+
+
+class Step:
+    def __init__(self, run, step, indices):
+        self.run = run
+        self.step = step
+        self.indices = indices
+
+    def events(self):
+        ds = self.run.ds
+        for i in self.indices:
+            yield Event(i, self.step, (ds.seed, self.run.runnum, i))
+
+
+class Event:
+    def __init__(self, index, step, seed):
+        self.index = index
+        self.step = step
+        self.seed = seed
+        self.cache = {}
+        ns = 1_600_000_000*1_000_000_000 + index*EVENT_PERIOD_NS
+        self.timestamp = ((ns // 1_000_000_000) << 32) | (ns % 1_000_000_000)
+
+    def rng(self, tag):
+        # one stream per consumer, so values do not depend on the order detectors are read
+        return np.random.default_rng(self.seed + (zlib.crc32(tag.encode()),))
+
+
+class EventModel:
+    """
+    Shared per-event physics: pulse energy, laser on/off, destination and the
+    DLD hits of each detector. Detectors read consistent values through the
+    event cache.
+    """
+    def __init__(self, alg_params, mean_hits):
+        self.alg_params = alg_params
+        self.mean_hits = mean_hits
+
+    def beam(self, evt):
+        if 'beam' not in evt.cache:
+            rng = evt.rng('beam')
+            laser = int(rng.random() < 0.5)
+            evt.cache['beam'] = {
+                'gmd': rng.gamma(16., 0.5/16.),
+                'laser': laser,
+                'dest': 4 if rng.random() < 0.9 else 2,
+                'codes': {280: laser, 281: 1-laser, 282: int(evt.index % 10 == 0)},
+            }
+        return evt.cache['beam']
+
+    def hits(self, evt, det_id):
+        """Arrival times (ns, before offsets) of every DLD channel of detector `det_id`."""
+        key = 'hits_'+det_id
+        if key not in evt.cache:
+            beam = self.beam(evt)
+            hr = self.alg_params[det_id]['hr']
+            rng = evt.rng(key)
+            n = min(rng.poisson(self.mean_hits*beam['gmd']/0.5), hr['max_hits'])
+
+            t = TOF_SCALE*np.sqrt(rng.choice(SPECIES, n)) + rng.normal(0, 2., n)
+            r_max = 0.9*min(hr['rMCP'], *(hr['runtime_'+k]*hr['f_'+k]/2 for k in 'uvw'))
+            r = r_max*np.sqrt(rng.random(n))
+            phi = 2*np.pi*rng.random(n)
+            x, y = r*np.cos(phi), r*np.sin(phi)
+
+            # invert HitFinder: x = sub_u*f_u/2, y = (x - sub_v*f_v)/sqrt(3)
+            sub = {'u': 2*x/hr['f_u'], 'v': (x - np.sqrt(3)*y)/hr['f_v'], 'w': (x + np.sqrt(3)*y)/hr['f_w']}
+            chans = {'mcp': t}
+            for k in 'uvw':
+                tsum = rng.normal(0, hr['tsum_hw_'+k]/4, n)
+                chans[k+'1'] = t + (sub[k] + tsum)/2 + (hr['tsum_avg_'+k] + hr[k+'_diff_offset'])/2
+                chans[k+'2'] = t + (tsum - sub[k])/2 + (hr['tsum_avg_'+k] - hr[k+'_diff_offset'])/2
+            evt.cache[key] = chans
+        return evt.cache[key]
+
+
+class Hsd:
+    """FEX digitizer with one or two channels; mirrors det.raw.peaks/fex_status/waveforms/padded."""
+    def __init__(self, model, det_id, name, vals):
+        self.raw = self
+        self.model = model
+        self.det_id = det_id
+        det = model.alg_params[det_id]['det']
+        layer = name.split('_')[-1][1:]
+        self.chans = {}
+        for j, k2 in enumerate(vals):
+            sig_name = 'mcp' if layer == 'mcp' else layer+str(j+1)
+            if 'mcp' in name: cfd = det['mcp']
+            elif name+k2 == 'dream_hsd_lv0' and 'v1' in det: cfd = det['v1']
+            elif name+k2 == 'dream_hsd_lw1' and 'w2' in det: cfd = det['w2']
+            else: cfd = det['dld']
+            self.chans[int(k2)] = (sig_name, cfd)
+
+    def pulses(self, evt, chan):
+        # FEX windows (starts, amps) around every pulse; CFD of a gaussian of width delay/2
+        # with fraction 1 crosses at its centre minus delay/2, so pulses are shifted by that
+        sig_name, cfd = self.chans[chan]
+        key = (self.det_id, sig_name)
+        if key not in evt.cache:
+            times = np.sort(self.model.hits(evt, self.det_id)[sig_name])
+            delay = int(cfd['delay']/cfd['sample_interval'])
+            width = delay/2
+            rng = evt.rng(f'{self.det_id}{sig_name}')
+            centers = times/FEX_DT + delay/2
+            heights = rng.uniform(2.5, 8.)*cfd['threshold']*np.ones(times.size)
+            pre, post = int(4*width) + delay, int(4*width) + 2*delay
+            starts, amps = [], []
+            i = 0
+            while i < centers.size:
+                j = i + 1
+                while j < centers.size and centers[j] - centers[j-1] < pre + post: j += 1
+                start = int(centers[i]) - pre
+                x = np.arange(start, int(centers[j-1]) + post)
+                a = cfd['offset'] + rng.normal(0, 15., x.size)
+                for c, h in zip(centers[i:j], heights[i:j]):
+                    a -= h*np.exp(-0.5*((x-c)/width)**2)
+                starts.append(start)
+                amps.append(np.round(a).astype(np.int16))
+                i = j
+            evt.cache[key] = (starts, amps)
+        return evt.cache[key]
+
+    def peaks(self, evt):
+        return {chan: [self.pulses(evt, chan)] for chan in self.chans}
+
+    def fex_status(self, evt):
+        return {chan: np.zeros((1, 1, 1), dtype=np.int32) for chan in self.chans}
+
+    def padded(self, evt):
+        out = {}
+        for chan in self.chans:
+            starts, amps = self.pulses(evt, chan)
+            offset = self.chans[chan][1]['offset']
+            n = max([s + len(a) for s, a in zip(starts, amps)], default=0)
+            wf = np.full(n, offset, dtype=float)
+            for s, a in zip(starts, amps): wf[s:s+len(a)] = a
+            out[chan] = {0: wf}
+        return out
+
+    def waveforms(self, evt):
+        out = {}
+        for chan, padded in self.padded(evt).items():
+            wf = padded[0]
+            n = int(self.chans[chan][1]['timerange_high']/FEX_DT) + 1
+            full = np.full(n, self.chans[chan][1]['offset'], dtype=float)
+            full[:min(n, wf.size)] = wf[:n]
+            out[chan] = {0: full, 'times': np.arange(n)*FEX_DT*1e-9}
+        return out
+
+
+class Timing:
+    def __init__(self, model):
+        self.raw = self
+        self.model = model
+
+    def eventcodes(self, evt):
+        codes = np.zeros(300, dtype=np.int32)
+        for code, value in self.model.beam(evt)['codes'].items(): codes[code] = value
+        return codes
+
+    def destination(self, evt):
+        return self.model.beam(evt)['dest']
+
+
+class Bld:
+    def __init__(self, model, name):
+        self.raw = self
+        self.model = model
+        self.scale = 1. if name == 'gmd' else 0.8
+
+    def milliJoulesPerPulse(self, evt):
+        return self.scale*self.model.beam(evt)['gmd']
+
+
+class ScanVar:
+    def __init__(self, i):
+        self.i = i
+
+    def __call__(self, evt):
+        return 0.1*evt.step if self.i == 0 else 10.*(evt.step % 2)
+
+
+class Atm:
+    """Spectrometer line; laser-on events carry an edge that moves with the scan step."""
+    def __init__(self, model):
+        self.raw = AtmRaw(model)
+
+
+class AtmRaw:
+    def __init__(self, model):
+        self.model = model
+        self.x = np.arange(2048)
+
+    def raw(self, evt):
+        beam = self.model.beam(evt)
+        rng = evt.rng('atm')
+        line = 1000.*np.exp(-0.5*((self.x-1024)/350.)**2) + 50.
+        if beam['laser']:
+            edge = 900 + 20*evt.step + rng.normal(0, 5.)
+            line *= 1 - 0.2/(1 + np.exp((self.x-edge)/8.))
+        return line + rng.normal(0, 5., self.x.size)
+
+
+class SmallData:
+    """
+    Stand-in for ds.smalldata: with callbacks every event is handed to them
+    (online), otherwise events are written to `filename` every `batch_size` events.
+
+    Nested keys are joined with '/'. Groups named var_* are stored ragged like
+    psana does: members concatenated plus a <group>_len dataset.
+    """
+    def __init__(self, filename, batch_size, callbacks, rank, size):
+        self.callbacks = callbacks
+        self.batch_size = max(int(batch_size), 1)
+        self.filename = filename
+        if filename is not None and size > 1:
+            self.filename = filename[:-3] + f'_part{rank}.h5'
+        self.rows = []
+        self.n_written = 0
+        self.file = None
+
+    def event(self, evt, *args, **kwargs):
+        data = {}
+        for arg in args: data.update(arg)
+        data.update(kwargs)
+        for callback in self.callbacks:
+            callback(data)
+        if self.filename is None:
+            return
+        row = {'timestamp': evt.timestamp}
+        flatten(data, '', row)
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.file is None:
+            import h5py
+            self.file = h5py.File(self.filename, 'w')
+        n = len(self.rows)
+        names = sorted(set().union(*self.rows))
+        for name in names:
+            vals = [row.get(name) for row in self.rows]
+            if name.endswith('_len'):
+                append_uniform(self.file, name, vals, self.n_written, fill=0)
+            elif '/var_' in '/'+name:
+                append_ragged(self.file, name, vals)
+            else:
+                append_uniform(self.file, name, vals, self.n_written)
+        self.n_written += n
+        self.rows = []
+
+    def done(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def flatten(d, prefix, out):
+    for k, v in d.items():
+        name = prefix + str(k)
+        if isinstance(v, dict):
+            flatten(v, name + '/', out)
+            if str(k).startswith('var_'):
+                lens = [np.size(x) for x in v.values()]
+                out[name + '_len'] = lens[0] if lens else 0
+        else:
+            out[name] = v
+
+
+def append_uniform(f, name, vals, n_before, fill=np.nan):
+    # missing rows (and rows before the dataset first appeared) get `fill`
+    ref = np.asarray(next(v for v in vals if v is not None))
+    if name in f:
+        dtype = f[name].dtype
+    elif any(v is None for v in vals) or n_before > 0:
+        dtype = np.result_type(ref.dtype, np.asarray(fill).dtype)
+    else:
+        dtype = ref.dtype
+    rows = np.stack([np.asarray(v) if v is not None else np.full(ref.shape, fill) for v in vals]).astype(dtype)
+    if name not in f:
+        f.create_dataset(name, shape=(n_before,) + ref.shape, maxshape=(None,) + ref.shape, dtype=dtype, fillvalue=fill)
+    ds = f[name]
+    start = ds.shape[0]
+    ds.resize(start + rows.shape[0], axis=0)
+    ds[start:] = rows
+
+
+def append_ragged(f, name, vals):
+    values = np.concatenate([np.ravel(v) for v in vals if v is not None]) if any(v is not None for v in vals) else np.empty((0,))
+    if name not in f:
+        f.create_dataset(name, shape=(0,), maxshape=(None,), dtype=values.dtype)
+    ds = f[name]
+    start = ds.shape[0]
+    ds.resize(start + values.size, axis=0)
+    ds[start:] = values.astype(ds.dtype)
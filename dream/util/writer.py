@@ -0,0 +1,192 @@
+import numpy as np
+from dream.util.merge import mpi_comm, merge_parts, part_files
+from dream.util.misc import missing_value
+
+
+def column_filters(data):
+    """
+    HDF5 filters from the `compression`/`compression_opts` of the offline.yaml
+    data groups and x_format entries, keyed by the path prefix they apply to.
+    """
+    groups = {'uniform': '{}', 'ragged': 'var_{}', 'ragged_split': '{}'}
+    filters = {}
+    for section, name in groups.items():
+        for k, c in (data.get(section) or {}).items():
+            if isinstance(c, dict) and c.get('compression'):
+                filters[section + '/' + name.format(k)] = (c['compression'], c.get('compression_opts'))
+    for k, c in (data.get('x_format') or {}).items():
+        if isinstance(c, dict) and c.get('compression'):
+            filters['x/' + k] = (c['compression'], c.get('compression_opts'))
+    return filters
+
+
+def as_column(value, dtype):
+    """`value` ready to store in an integer column: NaN and inf become the missing value."""
+    if dtype.kind not in 'iu':
+        return value
+    value = np.asarray(value)
+    if value.dtype.kind != 'f':
+        return value
+    bad = ~np.isfinite(value)
+    if not bad.any():
+        return value
+    out = np.where(bad, 0, value).astype(dtype)
+    out[bad] = missing_value(dtype)
+    return out
+
+
+class columnar_writer:
+    """
+    Per-rank columnar HDF5 writer with the smalldata `event`/`done` interface.
+
+    Nested event dicts are flattened into '/'-joined columns. Per-event values
+    go into preallocated (batch_size, ...) buffers and var_* groups into growable
+    ragged buffers plus a <group>_len column, the same layout smalldata writes.
+    Every `batch_size` events the buffers are appended to chunked, optionally
+    compressed datasets of this rank's file; `filters` overrides the default
+    compression by path prefix (see column_filters). With several ranks each
+    writes <name>_part<rank>.h5 and `done` merges them into <name>.h5 (see merge).
+    """
+    def __init__(self, filename, batch_size=1000, compression=None, compression_opts=None,
+                 ragged_chunk=65536, rank=0, size=1, index=False, filters=None):
+        self.final = filename
+        self.filename = filename[:-3] + f'_part{rank}.h5' if size > 1 else filename
+        self.rank = rank
+        self.size = size
+        self.index = index
+        self.batch_size = max(int(batch_size), 1)
+        self.ragged_chunk = max(int(ragged_chunk), 1)
+        self.compression = compression or None
+        self.compression_opts = compression_opts if self.compression else None
+        self.filters = filters or {}
+        self.uniform = {}    # name -> (batch_size, ...) buffer
+        self.ragged = {}     # name -> [buffer, fill]
+        self.row = 0
+        self.n_written = 0
+        self.file = None
+
+    def event(self, evt, *args, **kwargs):
+        data = {}
+        for arg in args: data.update(arg)
+        data.update(kwargs)
+        # an event is written whole or not at all: on failure the ragged fills,
+        # the row and any column it created are rolled back before re-raising
+        fills = {name: entry[1] for name, entry in self.ragged.items()}
+        columns = set(self.uniform)
+        try:
+            self._put('timestamp', evt.timestamp)
+            self._walk(data, '')
+        except Exception:
+            self._rollback(fills, columns)
+            raise
+        self.row += 1
+        if self.row == self.batch_size:
+            self.flush()
+
+    def _walk(self, d, prefix):
+        for k, v in d.items():
+            name = prefix + str(k)
+            if not isinstance(v, dict):
+                self._put(name, v)
+            elif str(k).startswith('var_'):
+                n = None
+                for member, values in v.items():
+                    values = np.ravel(values)
+                    if n is None: n = values.size
+                    self._extend(name + '/' + str(member), values)
+                self._put(name + '_len', n or 0)
+            else:
+                self._walk(v, name + '/')
+
+    def _rollback(self, fills, columns):
+        for name in list(self.ragged):
+            if name in fills:
+                self.ragged[name][1] = fills[name]
+            else:
+                del self.ragged[name]
+        for name in list(self.uniform):
+            if name in columns:
+                buf = self.uniform[name]
+                buf[self.row] = missing_value(buf.dtype)
+            else:
+                del self.uniform[name]
+
+    def _put(self, name, value):
+        buf = self.uniform.get(name)
+        if buf is None:
+            value = np.asarray(value)
+            buf = np.full((self.batch_size,) + value.shape, missing_value(value.dtype), dtype=value.dtype)
+            self.uniform[name] = buf
+        buf[self.row] = as_column(value, buf.dtype)
+
+    def _extend(self, name, values):
+        entry = self.ragged.get(name)
+        if entry is None:
+            entry = self.ragged[name] = [np.empty(max(self.ragged_chunk, values.size), dtype=values.dtype), 0]
+        buf, fill = entry
+        stop = fill + values.size
+        if stop > buf.size:
+            grown = np.empty(max(stop, 2*buf.size), dtype=buf.dtype)
+            grown[:fill] = buf[:fill]
+            entry[0] = buf = grown
+        buf[fill:stop] = as_column(values, buf.dtype)
+        entry[1] = stop
+
+    def _filter(self, name):
+        # longest configured path prefix of `name` ('x/timing' covers 'x/timing:280'), else the default
+        while True:
+            f = self.filters.get(name)
+            if f is None and ':' in name:
+                f = self.filters.get(name.split(':')[0])
+            if f is not None:
+                return f
+            if '/' not in name:
+                return self.compression, self.compression_opts
+            name = name.rsplit('/', 1)[0]
+
+    def _dataset(self, name, buf, rows, chunk):
+        ds = self.file.get(name)
+        if ds is None:
+            tail = buf.shape[1:]
+            compression, compression_opts = self._filter(name)
+            ds = self.file.create_dataset(
+                name, shape=(rows,) + tail, maxshape=(None,) + tail, dtype=buf.dtype,
+                chunks=(chunk,) + tail, fillvalue=missing_value(buf.dtype),
+                compression=compression, compression_opts=compression_opts)
+        return ds
+
+    def flush(self):
+        n = self.row
+        if n == 0:
+            return
+        if self.file is None:
+            import h5py
+            self.file = h5py.File(self.filename, 'w')
+        for name, buf in self.uniform.items():
+            # a column first seen in this batch reads as missing for the earlier events
+            ds = self._dataset(name, buf, self.n_written, self.batch_size)
+            ds.resize(self.n_written + n, axis=0)
+            ds[self.n_written:] = buf[:n]
+            buf[:n] = missing_value(buf.dtype)
+        for name, entry in self.ragged.items():
+            buf, fill = entry
+            ds = self._dataset(name, buf, 0, self.ragged_chunk)
+            start = ds.shape[0]
+            ds.resize(start + fill, axis=0)
+            ds[start:] = buf[:fill]
+            entry[1] = 0
+        self.n_written += n
+        self.row = 0
+
+    def done(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.size > 1:
+            comm = mpi_comm()
+            if comm is None:
+                return
+            comm.Barrier()
+            if self.rank == 0:
+                merge_parts(self.final, part_files(self.final), self.index)
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip('h5py')
+
+from dream.util.writer import columnar_writer
+
+
+def write(path, events):
+    w = columnar_writer(str(path), batch_size=2)
+    for i, (z, dest) in enumerate(events):
+        try:
+            w.event(SimpleNamespace(timestamp=i), {'ragged': {'var_l': {'z': z}}, 'x': {'dest': dest}})
+        except ValueError:
+            pass
+    w.done()
+    with h5py.File(path, 'r') as f:
+        return {name: f[name][()] for name in ('timestamp', 'ragged/var_l_len', 'ragged/var_l/z', 'x/dest')}
+
+
+def test_nan_in_int_column_is_missing(tmp_path):
+    out = write(tmp_path / 'run.h5', [(np.arange(2.), 1), (np.arange(3.), np.nan), (np.arange(1.), 3)])
+    assert out['x/dest'].tolist() == [1, -1, 3]
+    assert out['ragged/var_l_len'].tolist() == [2, 3, 1]
+    assert out['ragged/var_l/z'].tolist() == [0, 1, 0, 1, 2, 0]
+
+
+def test_failed_event_is_not_written(tmp_path):
+    # the second event fails after its hits were appended; none of it may stay behind
+    out = write(tmp_path / 'run.h5', [(np.arange(2.), 1), (np.arange(3.), [1, 2]), (np.arange(1.), 3)])
+    assert out['timestamp'].tolist() == [0, 2]
+    assert out['x/dest'].tolist() == [1, 3]
+    assert out['ragged/var_l_len'].tolist() == [2, 1]
+    assert out['ragged/var_l/z'].tolist() == [0, 1, 0]